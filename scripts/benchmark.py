@@ -0,0 +1,335 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SAMPLE_RATE = 16000
+
+# Словарь для детерминированного «транскрипта» заглушки Whisper
+STUB_WORDS = (
+    "коллеги итак давайте обсудим план релиза сроки задачи бюджет команда клиент "
+    "решили поручить подготовить отчет до пятницы проверить тесты согласовать "
+    "Иван Мария Петр Анна следующий шаг вопрос риск договорились"
+).split()
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Локальная замена Ollama: отвечает на /api/tags и потоково на /api/generate"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, payload):
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": name} for name in self.server.models]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/generate":
+            return self.send_error(404)
+
+        prompt = request.get("prompt", "")
+        if not prompt:
+            # Предзагрузка модели (keep_alive без запроса)
+            return self._send_json({"model": request.get("model"), "response": "", "done": True})
+
+        server = self.server
+        prompt_tokens = server.count_tokens(prompt)
+        eval_tokens = server.response_tokens
+        prompt_seconds = prompt_tokens / server.prompt_rate
+        eval_seconds = eval_tokens / server.token_rate
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(prompt_seconds)
+        for i in range(eval_tokens):
+            time.sleep(1 / server.token_rate)
+            self._send_chunk({"response": f"- пункт {i}\n" if i % 10 == 0 else "слово ", "done": False})
+        self._send_chunk({
+            "response": "",
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+        })
+        self.wfile.write(b"0\r\n\r\n")
+        with server.lock:
+            server.requests += 1
+            server.prompt_tokens += prompt_tokens
+            server.eval_tokens += eval_tokens
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """HTTP-сервер с детерминированной скоростью обработки запроса и генерации"""
+    daemon_threads = True
+
+    def __init__(self, token_rate=200.0, prompt_rate=2000.0, response_tokens=200, models=("gemma3:27b",)):
+        super().__init__(("127.0.0.1", 0), FakeOllamaHandler)
+        self.token_rate = token_rate
+        self.prompt_rate = prompt_rate
+        self.response_tokens = response_tokens
+        self.models = list(models)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @staticmethod
+    def count_tokens(text):
+        """Грубая оценка: около 4 символов на токен"""
+        return max(1, len(text) // 4)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def counters(self):
+        with self.lock:
+            return {"requests": self.requests, "prompt_tokens": self.prompt_tokens, "eval_tokens": self.eval_tokens}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+class StubWhisperEngine:
+    """Заглушка движка транскрибации с заданным коэффициентом реального времени (RTF)"""
+    def __init__(self, rtf=0.002, seed=0, model_name="stub", language="ru"):
+        self.rtf = rtf
+        self.seed = seed
+        self.model_name = model_name
+        self.language = language
+
+    def load(self):
+        return self
+
+    def transcribe(self, audio, **options):
+        if isinstance(audio, (str, Path)):
+            with wave.open(str(audio), "rb") as f:
+                duration = f.getnframes() / f.getframerate()
+        else:
+            duration = len(audio) / SAMPLE_RATE
+        time.sleep(duration * self.rtf)
+
+        rng = random.Random(f"{self.seed}:{duration}")
+        segments = []
+        for start in range(0, int(duration), 5):
+            # Около 2.5 слов в секунду, как в живой речи
+            text = " ".join(rng.choice(STUB_WORDS) for _ in range(12)).capitalize() + "."
+            segments.append({"start": float(start), "end": float(min(start + 5, duration)), "text": text})
+        return {"text": "\n".join(s["text"] for s in segments), "segments": segments, "language": self.language}
+
+def write_synthetic_wav(path, seconds, seed=0):
+    """Создает WAV 16 кГц моно заданной длины (тихий детерминированный шум)"""
+    rng = random.Random(seed)
+    block = bytes(rng.getrandbits(8) & 0x0F for _ in range(SAMPLE_RATE * 2))
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        for _ in range(int(seconds)):
+            f.writeframes(block)
+    return path
+
+def decode_wav(audio_path, pcm_path, normalize=False):
+    """
+    Замена ffmpeg_decode для заглушки Whisper: синтетические записи — WAV 16 кГц моно,
+    поэтому в PCM float32 они переводятся без ffmpeg и замер остается автономным.
+    """
+    import numpy as np
+    with wave.open(str(audio_path), "rb") as f:
+        pcm = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2")
+    (pcm.astype(np.float32) / 32768).tofile(pcm_path)
+
+def load_processing_module(script_path=None, target_dir="."):
+    """Импортирует summarize.py; если путь не задан, генерирует скрипт установщиком в target_dir"""
+    if script_path is None or not Path(script_path).exists():
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        import install
+        target_dir = Path(target_dir)
+        cwd = os.getcwd()
+        try:
+            os.chdir(target_dir)
+            with contextlib.redirect_stdout(io.StringIO()):
+                install.create_processing_script()
+        finally:
+            os.chdir(cwd)
+        script_path = target_dir / "summarize.py"
+    spec = importlib.util.spec_from_file_location("summarize", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def timed(func, *args, quiet=True, **kwargs):
+    """Выполняет функцию и возвращает (результат, секунды по монотонным часам)"""
+    start = time.perf_counter()
+    if quiet:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args, **kwargs)
+    else:
+        result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def benchmark_length(S, engine, server, seconds, work_dir):
+    """Замеряет стадии для одной записи: холодный прогон и повтор из кэша"""
+    audio_path = write_synthetic_wav(work_dir / f"audio_{seconds}s.wav", seconds)
+    job_dir = work_dir / f"job_{seconds}s"
+    job_dir.mkdir(exist_ok=True)
+    cache = S.ResultCache(work_dir / f"cache_{seconds}s")
+
+    (transcript, _), transcribe_sec = timed(S.transcribe_audio, audio_path, job_dir, engine=engine, cache=cache)
+    if transcript is None:
+        raise RuntimeError(f"транскрибация {audio_path.name} не удалась "
+                           "(с настоящим Whisper запись декодируется через ffmpeg — проверьте, что он установлен)")
+    before = server.counters() if server else None
+    summary, summarize_sec = timed(S.summarize_text, transcript, cache=cache)
+    after = server.counters() if server else None
+    _, transcribe_cached_sec = timed(S.transcribe_audio, audio_path, job_dir, engine=engine, cache=cache)
+    _, summarize_cached_sec = timed(S.summarize_text, transcript, cache=cache)
+
+    result = {
+        "audio_seconds": seconds,
+        "transcript_chars": len(transcript),
+        "chunks": len(S.split_into_chunks(transcript)),
+        "transcribe_sec": round(transcribe_sec, 4),
+        "rtf": round(transcribe_sec / seconds, 5),
+        "summarize_sec": round(summarize_sec, 4),
+        "transcribe_cached_sec": round(transcribe_cached_sec, 4),
+        "summarize_cached_sec": round(summarize_cached_sec, 4),
+        "summary_ok": bool(summary),
+    }
+    if before and after:
+        eval_tokens = after["eval_tokens"] - before["eval_tokens"]
+        result.update({
+            "llm_requests": after["requests"] - before["requests"],
+            "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+            "eval_tokens": eval_tokens,
+            "llm_tokens_per_sec": round(eval_tokens / summarize_sec, 2) if summarize_sec else None,
+        })
+    return result
+
+def benchmark_batch(S, engine, lengths, work_dir, summarize_workers):
+    """Замеряет конвейер на всех записях сразу: выигрыш от перекрытия стадий"""
+    files = [write_synthetic_wav(work_dir / f"batch_{i}_{seconds}s.wav", seconds, seed=i)
+             for i, seconds in enumerate(lengths)]
+    original = S.get_whisper_engine
+    S.get_whisper_engine = lambda: engine
+    try:
+        jobs, total_sec = timed(S.run_pipeline, files, work_dir / "batch_out",
+                                summarize_workers=summarize_workers)
+    finally:
+        S.get_whisper_engine = original
+    return {
+        "files": len(files),
+        "audio_seconds": sum(lengths),
+        "total_sec": round(total_sec, 4),
+        "failed": sum(1 for job in jobs if job["error"]),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера транскрибации и саммаризации")
+    parser.add_argument("--lengths", default="60,600,1800",
+                        help="длины синтетических записей в секундах через запятую")
+    parser.add_argument("--script", help="путь к сгенерированному summarize.py (по умолчанию генерируется заново)")
+    parser.add_argument("--stub-rtf", type=float, default=0.002,
+                        help="RTF заглушки Whisper (доля длительности записи, уходящая на «транскрибацию»)")
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="токенов/с генерации у фейкового Ollama")
+    parser.add_argument("--prompt-rate", type=float, default=50000.0, help="токенов/с обработки запроса у фейкового Ollama")
+    parser.add_argument("--response-tokens", type=int, default=100, help="длина ответа фейкового Ollama в токенах")
+    parser.add_argument("--whisper-model", help="замерять настоящий Whisper с этой моделью вместо заглушки")
+    parser.add_argument("--ollama-url", help="замерять настоящий сервер Ollama вместо фейкового")
+    parser.add_argument("--summarize-workers", type=int, default=1, help="потоков саммаризации в пакетном замере")
+    parser.add_argument("-o", "--output", help="файл для JSON с результатами (по умолчанию stdout)")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    lengths = [int(x) for x in args.lengths.split(",") if x.strip()]
+
+    with contextlib.ExitStack() as stack:
+        # Сгенерированный скрипт, записи и результаты живут в одном временном каталоге и удаляются вместе с ним
+        work_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="summarizer-bench-")))
+        S = load_processing_module(args.script, work_dir)
+        if args.whisper_model:
+            engine = S.WhisperEngine(args.whisper_model)
+        else:
+            engine = StubWhisperEngine(args.stub_rtf)
+            S.ffmpeg_decode = decode_wav
+
+        server = None
+        if args.ollama_url:
+            url = args.ollama_url
+        else:
+            server = stack.enter_context(FakeOllamaServer(args.token_rate, args.prompt_rate, args.response_tokens))
+            url = server.url
+        S.OLLAMA_URL = url
+        S._ollama_client = S.OllamaClient(base_url=url)
+
+        results = []
+        for seconds in lengths:
+            print(f"⏱️  Запись {seconds} с...", file=sys.stderr)
+            try:
+                results.append(benchmark_length(S, engine, server, seconds, work_dir))
+            except RuntimeError as e:
+                print(f"❌ {e}", file=sys.stderr)
+                sys.exit(1)
+        print("⏱️  Пакетный конвейер...", file=sys.stderr)
+        batch = benchmark_batch(S, engine, lengths, work_dir, args.summarize_workers)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "whisper": args.whisper_model or f"stub(rtf={args.stub_rtf})",
+            "ollama": args.ollama_url or f"fake(token_rate={args.token_rate}, prompt_rate={args.prompt_rate})",
+            "chunk_tokens": S.CHUNK_TOKENS,
+            "max_parallel_requests": S.MAX_PARALLEL_REQUESTS,
+        },
+        "results": results,
+        "batch": batch,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+        print(f"✅ Результаты сохранены в {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
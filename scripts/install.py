@@ -4,25 +4,83 @@ import os
 import platform
 import requests
 import time
+import argparse
+import hashlib
+import importlib
+import importlib.metadata
+import importlib.util
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import timedelta
+
+# Таймаут для коротких команд; длинные загрузки идут потоково без общего таймаута
+COMMAND_TIMEOUT = 300
+# Сколько секунд ждать очередную порцию данных при загрузке, прежде чем переподключиться
+DOWNLOAD_READ_TIMEOUT = 120
+DOWNLOAD_RETRIES = 5
+# Прогресс загрузки печатается с таким шагом в процентах
+PROGRESS_STEP = 5
+OLLAMA_URL = "http://localhost:11434"
+DEFAULT_WHISPER_MODEL = "large-v3"
+DEFAULT_LLM_MODEL = "gemma3:27b"
+
+def format_duration(seconds):
+    """Форматирует длительность с точностью до миллисекунд: 0:01:02.345"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    return f"{hours}:{minutes:02d}:{millis // 1000:02d}.{millis % 1000:03d}"
+
+def format_size(size):
+    """Форматирует размер в байтах: 1.5 ГБ"""
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
 
 def log_time(step_name, start_time):
     """Логирует время выполнения этапа"""
     elapsed = time.time() - start_time
-    print(f"⏱️  {step_name} заняло: {timedelta(seconds=int(elapsed))}")
+    print(f"⏱️  {step_name} заняло: {format_duration(elapsed)}")
 
-def run_command(command, check=True, shell_override=None):
+def run_command(command, check=True, shell_override=None, timeout=COMMAND_TIMEOUT, stream=False, label=None):
     """
     Универсальная функция для выполнения команд в оболочке с обработкой ошибок.
+    При stream=True вывод печатается построчно по мере выполнения (с префиксом label),
+    а команда не ограничивается таймаутом: так идут pip и другие долгие загрузки.
     """
     # Определяем, нужно ли использовать shell=True (по умолчанию для Windows, False для Unix)
     if shell_override is None:
         shell_override = (platform.system() == "Windows")
     
+    if stream:
+        prefix = f"[{label}] " if label else ""
+        try:
+            print(f"🛠️ {prefix}Выполняется команда: {command}")
+            process = subprocess.Popen(command, shell=shell_override, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, text=True, bufsize=1)
+            lines = []
+            for line in process.stdout:
+                line = line.rstrip()
+                lines.append(line)
+                if line:
+                    print(f"   {prefix}{line}")
+            process.wait()
+        except OSError as e:
+            print(f"❌ Ошибка при выполнении команды '{command}': {e}")
+            return str(e), False
+        output = "\n".join(lines)
+        if process.returncode != 0 and check:
+            print(f"❌ Ошибка при выполнении команды '{command}' (код {process.returncode})")
+            return output, False
+        print(f"✅ {prefix}Успех: {command}")
+        return output, True
+
     try:
         print(f"🛠️ Выполняется команда: {command}")
-        result = subprocess.run(command, shell=shell_override, check=check, capture_output=True, text=True, timeout=300)
+        result = subprocess.run(command, shell=shell_override, check=check, capture_output=True, text=True, timeout=timeout)
         print(f"✅ Успех: {result.stdout}")
         return result.stdout, True
     except subprocess.CalledProcessError as e:
@@ -32,9 +90,87 @@ def run_command(command, check=True, shell_override=None):
         print(f"⏰ Таймаут при выполнении команды: {command}")
         return "Timeout", False
 
-def install_ffmpeg():
+def package_installed(name):
+    """Проверяет по метаданным, установлен ли pip-пакет, не импортируя его."""
+    try:
+        importlib.metadata.version(name)
+        return True
+    except importlib.metadata.PackageNotFoundError:
+        return False
+
+def pip_install(packages, label, extra_args=()):
+    """Устанавливает pip-пакеты, печатая вывод pip по мере установки."""
+    output, success = run_command([sys.executable, "-m", "pip", "install", *packages, *extra_args],
+                                  stream=True, label=label)
+    importlib.invalidate_caches()
+    return success
+
+def file_sha256(path):
+    """Считает SHA-256 файла блоками."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def download_file(url, destination, expected_sha256=None, label=None):
+    """
+    Скачивает файл с докачкой: данные пишутся в <файл>.part, после обрыва
+    загрузка продолжается с места остановки (HTTP Range). Общего таймаута нет,
+    переподключение происходит, только если сервер замолчал надолго.
+    """
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    partial = destination.with_name(destination.name + ".part")
+    prefix = f"[{label}] " if label else ""
+
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        offset = partial.stat().st_size if partial.exists() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=(10, DOWNLOAD_READ_TIMEOUT)) as response:
+                if response.status_code == 416:
+                    # Частичный файл уже содержит все данные
+                    break
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    print(f"⚠️ {prefix}Сервер не поддерживает докачку, загрузка начнется заново")
+                    offset = 0
+                elif offset:
+                    print(f"↪️ {prefix}Продолжаем загрузку с {format_size(offset)}")
+                total = offset + int(response.headers.get("Content-Length", 0))
+                reported = -1
+                with open(partial, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+                        offset += len(chunk)
+                        if total:
+                            percent = int(offset * 100 / total) // PROGRESS_STEP * PROGRESS_STEP
+                            if percent > reported:
+                                reported = percent
+                                print(f"📥 {prefix}{percent}% ({format_size(offset)} из {format_size(total)})")
+            break
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️ {prefix}Загрузка прервана ({e}), попытка {attempt}/{DOWNLOAD_RETRIES}")
+            time.sleep(min(30, 2 ** attempt))
+    else:
+        print(f"❌ {prefix}Не удалось скачать {url}")
+        return False
+
+    if expected_sha256 and file_sha256(partial) != expected_sha256:
+        print(f"❌ {prefix}Контрольная сумма {destination.name} не совпала, файл удален")
+        partial.unlink()
+        return False
+    partial.replace(destination)
+    return True
+
+def install_ffmpeg(force=False):
     """Устанавливает FFmpeg в зависимости от операционной системы."""
     step_start = time.time()
+    if not force and shutil.which("ffmpeg"):
+        print("⏭️  FFmpeg уже установлен, шаг пропущен.")
+        return True
+
     system = platform.system()
     print(f"🔍 Обнаружена система: {system}")
     
@@ -103,28 +239,36 @@ def install_ffmpeg():
     log_time("Установка FFmpeg", step_start)
     return True
 
-def install_whisper():
+def whisper_model_path(model_name):
+    """
+    Возвращает URL модели Whisper, ее SHA-256 и путь, по которому
+    whisper.load_model ищет файл в кэше.
+    """
+    import whisper
+    url = whisper._MODELS[model_name]
+    cache_root = os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    # В URL моделей Whisper предпоследний компонент пути — SHA-256 файла
+    return url, url.split("/")[-2], Path(cache_root) / "whisper" / os.path.basename(url)
+
+def install_whisper(force=False):
     """
-    Устанавливает OpenAI Whisper и загружает модель large-v3.
+    Устанавливает OpenAI Whisper (вместе с torch с PyPI).
     """
     step_start = time.time()
     
-    print("📻 Установка OpenAI Whisper...")
-    # Устанавливаем пакет
-    output, success = run_command([sys.executable, "-m", "pip", "install", "-U", "openai-whisper"])
-    if not success:
-        print("❌ Не удалось установить openai-whisper.")
-        return False
+    if not force and package_installed("openai-whisper"):
+        print("⏭️  openai-whisper уже установлен, установка пакета пропущена.")
+    else:
+        print("📻 Установка OpenAI Whisper...")
+        if not pip_install(["-U", "openai-whisper"], "whisper"):
+            print("❌ Не удалось установить openai-whisper.")
+            return False
     
-    # Попытка проверить установку, импортировав whisper и загрузив модель base (для экономии времени на проверку)
+    # Для проверки достаточно импорта: модель в память не загружаем
     print("🔍 Проверка установки Whisper...")
     try:
         import whisper
-        # Пробуем загрузить маленькую модель для проверки
-        model = whisper.load_model("base")
-        print("✅ Whisper установлен и работает корректно.")
-        # Сообщаем, что large-v3 будет загружена при первом использовании
-        print("ℹ️  Модель 'large-v3' будет автоматически загружена при первом вызове транскрибации.")
+        print(f"✅ Whisper установлен, доступные модели: {', '.join(whisper.available_models())}")
     except Exception as e:
         print(f"❌ Проверка Whisper не удалась: {e}")
         return False
@@ -132,28 +276,59 @@ def install_whisper():
     log_time("Установка Whisper", step_start)
     return True
 
-def install_nemo():
+def download_whisper_model(model_name=DEFAULT_WHISPER_MODEL, force=False):
+    """
+    Загружает модель Whisper (по умолчанию large-v3) в кэш whisper с докачкой.
+    Выполняется после установки пакета: адрес и контрольная сумма берутся из него.
+    """
+    step_start = time.time()
+    try:
+        url, sha256, model_path = whisper_model_path(model_name)
+    except KeyError:
+        print(f"❌ Неизвестная модель Whisper: {model_name}")
+        return False
+    except Exception as e:
+        print(f"❌ Проверка Whisper не удалась: {e}")
+        return False
+
+    if not force and model_path.exists() and file_sha256(model_path) == sha256:
+        print(f"⏭️  Модель Whisper '{model_name}' уже загружена: {model_path}")
+    else:
+        print(f"📥 Загрузка модели Whisper '{model_name}' в {model_path}...")
+        if not download_file(url, model_path, sha256, label=f"whisper {model_name}"):
+            return False
+        print(f"✅ Модель Whisper '{model_name}' загружена.")
+
+    log_time("Загрузка модели Whisper", step_start)
+    return True
+
+def install_nemo(force=False):
     """
     Устанавливает NVIDIA NeMo Toolkit.
     Установка через pip может быть проблематичной, особенно на macOS и Windows.
     """
     step_start = time.time()
     
+    if not force and package_installed("nemo_toolkit"):
+        print("⏭️  NVIDIA NeMo уже установлен, шаг пропущен.")
+        return True
+
     print("🎙️ Установка NVIDIA NeMo Toolkit...")
     # Рекомендуется устанавливать в виртуальном окружении и предварительно установить torch и torchaudio
-    # Сначала попробуем установить зависимости
-    pip_commands = [
-        [sys.executable, "-m", "pip", "install", "torch", "torchaudio", "torchvision", "--index-url", "https://download.pytorch.org/whl/cpu"],
-        [sys.executable, "-m", "pip", "install", "Cython"],
-        [sys.executable, "-m", "pip", "install", "'nemo_toolkit[all]'"] # Пробуем установить все зависимости
-    ]
+    # Сначала попробуем установить зависимости (уже установленные пропускаем)
+    pip_commands = []
+    if force or not package_installed("torch"):
+        pip_commands.append((["torch", "torchaudio", "torchvision"], ["--index-url", "https://download.pytorch.org/whl/cpu"]))
+    if force or not package_installed("Cython"):
+        pip_commands.append((["Cython"], []))
+    pip_commands.append((["nemo_toolkit[all]"], [])) # Пробуем установить все зависимости
 
-    for cmd in pip_commands:
-        output, success = run_command(cmd)
-        if not success and "nemo_toolkit" in cmd[-1]:
+    for packages, extra_args in pip_commands:
+        success = pip_install(packages, "nemo", extra_args)
+        if not success and "nemo_toolkit" in packages[-1]:
             print("⚠️  Возникли проблемы при установке nemo_toolkit[all]. Пробуем установить базовую версию...")
             # Пробуем установить без [all]
-            output, success = run_command([sys.executable, "-m", "pip", "install", "nemo_toolkit"])
+            success = pip_install(["nemo_toolkit"], "nemo")
             if success:
                 print("✅ Nemo Toolkit (базовая версия) установлен.")
                 print("ℹ️  Для полноценной работы с диаризацией могут потребоваться дополнительные зависимости.")
@@ -165,26 +340,83 @@ def install_nemo():
     log_time("Установка NeMo", step_start)
     return True
 
-def install_ollama_and_gemma():
+def ollama_running():
+    """Проверяет, отвечает ли сервер Ollama."""
+    try:
+        return requests.get(f"{OLLAMA_URL}/api/tags", timeout=5).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+def ollama_has_model(model):
+    """Проверяет, загружена ли модель в Ollama."""
+    try:
+        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=10)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        return False
+    # Модель без тега Ollama хранит как <имя>:latest
+    wanted = model if ":" in model else f"{model}:latest"
+    return any(m.get("name") == wanted for m in response.json().get("models", []))
+
+def pull_ollama_model(model):
+    """
+    Загружает модель через API Ollama, печатая прогресс по мере загрузки.
+    Ollama сохраняет уже скачанные части, поэтому после обрыва повторный
+    запрос продолжает загрузку, а не начинает ее заново.
+    """
+    label = f"[{model}] "
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        try:
+            with requests.post(f"{OLLAMA_URL}/api/pull", json={"model": model, "stream": True},
+                               stream=True, timeout=(10, DOWNLOAD_READ_TIMEOUT)) as response:
+                response.raise_for_status()
+                last_status, reported = None, {}
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event.get("error"):
+                        raise RuntimeError(event["error"])
+                    status = event.get("status", "")
+                    total, completed = event.get("total"), event.get("completed")
+                    if total and completed is not None:
+                        percent = int(completed * 100 / total) // PROGRESS_STEP * PROGRESS_STEP
+                        if reported.get(event.get("digest")) != percent:
+                            reported[event.get("digest")] = percent
+                            print(f"📥 {label}{status}: {percent}% ({format_size(completed)} из {format_size(total)})")
+                    elif status != last_status:
+                        print(f"   {label}{status}")
+                    last_status = status
+                    if status == "success":
+                        return True
+        except (requests.exceptions.RequestException, RuntimeError, ValueError) as e:
+            print(f"⚠️ {label}Загрузка прервана ({e}), попытка {attempt}/{DOWNLOAD_RETRIES}")
+            time.sleep(min(30, 2 ** attempt))
+    return False
+
+def install_ollama_and_gemma(model=DEFAULT_LLM_MODEL, force=False):
     """
-    Устанавливает Ollama и загружает модель gemma3:27b.
+    Устанавливает Ollama и загружает модель (по умолчанию gemma3:27b).
     """
     step_start = time.time()
     
     system = platform.system()
-    print(f"🤖 Установка Ollama для {system}...")
-
-    if system == "Linux":
+    if not force and shutil.which("ollama"):
+        print("⏭️  Ollama уже установлена, установка пропущена.")
+        success = True
+    elif system == "Linux":
+        print(f"🤖 Установка Ollama для {system}...")
         # Установка через официальный скрипт
-        output, success = run_command("curl -fsSL https://ollama.com/install.sh | sh", shell_override=True)
+        output, success = run_command("curl -fsSL https://ollama.com/install.sh | sh", shell_override=True, stream=True, label="ollama")
     elif system == "Darwin":  # macOS
+        print(f"🤖 Установка Ollama для {system}...")
         # Проверяем, установлен ли Homebrew
         brew_check = subprocess.run("command -v brew", shell=True, capture_output=True, text=True)
         if brew_check.returncode == 0:
-            output, success = run_command("brew install ollama", shell_override=True)
+            output, success = run_command("brew install ollama", shell_override=True, stream=True, label="ollama")
         else:
             # Установка через скрипт
-            output, success = run_command("curl -fsSL https://ollama.com/install.sh | sh", shell_override=True)
+            output, success = run_command("curl -fsSL https://ollama.com/install.sh | sh", shell_override=True, stream=True, label="ollama")
     elif system == "Windows":
         print("👈 Для Windows загрузите и установите Ollama вручную с https://ollama.com/download")
         print("   После установки убедитесь, что сервис Ollama запущен, и вернитесь в скрипт.")
@@ -200,30 +432,32 @@ def install_ollama_and_gemma():
         return False
 
     # Запускаем сервер Ollama (на Linux/macOS он часто запускается автоматически как служба)
-    if system != "Windows":
-        # Пытаемся запустить сервер, если он не запущен
+    if system != "Windows" and not ollama_running():
         run_command("ollama serve > /dev/null 2>&1 &", shell_override=True, check=False)
-        time.sleep(3) # Даем серверу время на запуск
+        # Ждем, пока сервер начнет отвечать
+        for _ in range(30):
+            if ollama_running():
+                break
+            time.sleep(1)
 
     # Проверяем, работает ли сервер Ollama
-    try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=10)
-        if response.status_code == 200:
-            print("✅ Сервер Ollama запущен и отвечает.")
-        else:
-            print("⚠️ Сервер Ollama не ответил кодом 200. Возможно, потребуется его перезапуск.")
-    except requests.exceptions.ConnectionError:
+    if ollama_running():
+        print("✅ Сервер Ollama запущен и отвечает.")
+    else:
         print("⚠️ Не удалось подключиться к серверу Ollama. Попробуйте запустить его вручную командой 'ollama serve'.")
         success = False
 
-    # Загружаем модель gemma3:27b
+    # Загружаем модель, если ее еще нет
     if success:
-        print("📥 Загрузка модели gemma3:27b (это может занять время и потребовать ~12 ГБ места)...")
-        output, success = run_command("ollama pull gemma3:27b", shell_override=True)
-        if success:
-            print("✅ Модель gemma3:27b успешно загружена.")
+        if not force and ollama_has_model(model):
+            print(f"⏭️  Модель {model} уже загружена в Ollama.")
         else:
-            print("❌ Не удалось загрузить модель gemma3:27b.")
+            print(f"📥 Загрузка модели {model} (это может занять время)...")
+            success = pull_ollama_model(model)
+            if success:
+                print(f"✅ Модель {model} успешно загружена.")
+            else:
+                print(f"❌ Не удалось загрузить модель {model}.")
     
     log_time("Установка Ollama и загрузка модели", step_start)
     return success
@@ -235,18 +469,190 @@ def create_processing_script():
     step_start = time.time()
     
     script_content = '''import subprocess
-import requests
 import json
+import argparse
+import glob
+import gc
+import hashlib
+import importlib.util
+import math
+import queue
+import re
+import shutil
+import collections
+import contextlib
+import contextvars
+import functools
 import time
 import os
 import sys
 from pathlib import Path
-from datetime import timedelta
 import threading
+import weakref
 import itertools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, quote, urlparse
+
+# Параметры саммаризации длинных транскриптов (map-reduce)
+OLLAMA_URL = "http://localhost:11434"
+LLM_MODEL = "gemma3:27b"
+NUM_CTX_MIN = 2048            # Нижняя граница контекста модели
+NUM_CTX_MAX = 32768           # Верхняя граница контекста (KV-кэш растет с ним линейно)
+CHARS_PER_TOKEN = 3.5         # Начальная оценка символов на токен для русского текста
+CONTEXT_MARGIN = 1.15         # Запас на неточность оценки числа токенов
+CHUNK_TOKENS = 3500           # Размер фрагмента транскрипта в токенах
+CHUNK_OVERLAP = 250           # Перекрытие соседних фрагментов в токенах, чтобы не терять реплики на границах
+CHUNK_OUTPUT_TOKENS = 1024    # Резерв контекста под конспект одного фрагмента
+SECTION_OUTPUT_TOKENS = 400   # Резерв контекста под каждый раздел итогового краткого содержания
+MAX_PARALLEL_REQUESTS = 2     # Максимум одновременных запросов к Ollama (см. OLLAMA_NUM_PARALLEL)
+OLLAMA_STALL_TIMEOUT = 300    # Сколько секунд без новых токенов считать зависанием
+OLLAMA_LOAD_TIMEOUT = 300     # Запас на загрузку модели до первого токена
+OLLAMA_MIN_PROMPT_RATE = 5    # Самая медленная ожидаемая обработка запроса, ток/с (CPU, gemma3:27b)
+OLLAMA_START_TIMEOUT = 60     # Сколько секунд ждать запуска сервера Ollama
+OLLAMA_KEEP_ALIVE = "30m"     # Сколько модель остается в памяти после последнего запроса
+OLLAMA_RETRIES = 3            # Повторы при ошибках соединения и ответах 5xx
+OLLAMA_RETRY_BACKOFF = 1.0    # Базовая задержка перед повтором (удваивается)
+
+# Параметры транскрибации
+WHISPER_MODEL = "large-v3"
+WHISPER_LANGUAGE = "ru"
+WHISPER_MEMORY_GB = 12        # Примерный объем памяти под одну копию модели large-v3
+LLM_MEMORY_GB = 20            # Примерный объем памяти gemma3:27b в Ollama: веса (q4) около 17 ГБ плюс KV-кэш
+MEMORY_RESERVE_GB = 4         # Запас памяти для системы, ffmpeg и буферов записи
+
+# Профили моделей: скорости — грубые оценки для CPU с REFERENCE_CORES ядрами
+# (whisper_rtf — доля длительности записи на транскрибацию, llm_tps — токенов/с генерации)
+MODEL_TIERS = {
+    "fast": {"whisper": "small", "llm": "gemma3:4b",
+             "whisper_gb": 2, "llm_gb": 5, "whisper_rtf": 0.25, "llm_tps": 12},
+    "balanced": {"whisper": "turbo", "llm": "gemma3:12b",
+                 "whisper_gb": 6, "llm_gb": 10, "whisper_rtf": 0.6, "llm_tps": 5},
+    "quality": {"whisper": "large-v3", "llm": "gemma3:27b",
+                "whisper_gb": 12, "llm_gb": 20, "whisper_rtf": 2.0, "llm_tps": 2},
+}
+REFERENCE_CORES = 8
+GPU_SPEEDUP = 15              # Во сколько раз модели быстрее на видеокарте
+PROMPT_EVAL_SPEEDUP = 8       # Во сколько раз обработка запроса быстрее генерации
+SPEECH_TOKENS_PER_SEC = 4     # Примерно столько токенов транскрипта дает секунда речи
+AUTO_TARGET_RTF = 1.0         # В режиме auto обработка должна укладываться в длительность записи
+
+# Параметры сегментной (многопроцессной) транскрибации
+SAMPLE_RATE = 16000
+SILENCE_THRESHOLD_DB = 35     # Насколько кадр тише речи, чтобы считаться паузой
+MIN_SILENCE_SEC = 0.5         # Минимальная длина паузы, по которой можно резать
+MIN_SEGMENT_SEC = 60          # Отрезки короче теряют контекст и замедляют декодирование
+MAX_SEGMENT_SEC = 600         # Если пауз нет так долго, режем принудительно
+SEGMENT_THREADS_PER_WORKER = 4
+CHECKPOINT_PIECE_SEC = 480    # Длина отрезка с контрольной точкой (меньше MAX_SEGMENT_SEC, чтобы было где искать паузу)
+
+# Предобработка аудио
+TRIM_MIN_SILENCE_SEC = 2.0    # Паузы длиннее вырезаются перед транскрибацией
+TRIM_KEEP_SEC = 0.3           # Сколько тишины оставить с каждой стороны вырезанной паузы
+
+# Диаризация спикеров (NVIDIA NeMo)
+DIARIZATION_MAX_SPEAKERS = 8
+
+LLM_OPTIONS = {"temperature": 0.3, "top_p": 0.9}
+
+SUMMARY_SECTIONS = """
+            - Основные темы обсуждения
+            - Ключевые решения
+            - Действия и ответственные
+            - Следующие шаги
+            - Общая тональность встречи
+"""
+SUMMARY_OUTPUT_TOKENS = SECTION_OUTPUT_TOKENS * SUMMARY_SECTIONS.count("- ")
+
+# Очистка транскрипта перед саммаризацией
+CLEANUP_WINDOW = 8            # Сколько последних предложений проверять на почти точные повторы
+CLEANUP_SIMILARITY = 0.9      # Порог сходства, начиная с которого предложение считается повтором
+TIMESTAMP_EVERY_SEC = 60      # Как часто ставить метки времени в тексте для LLM
+
+# Шаблоны запросов к LLM (входят в ключ кэша саммари: правка шаблона сбрасывает кэш)
+SUMMARY_PROMPT = """
+            Создай подробное краткое содержание следующего текста встречи в формате Markdown.
+            Включи следующие разделы:
+            {sections}
+            Если реплики помечены спикерами («Спикер 1: ...»), в разделе «Действия и ответственные»
+            указывай, какой спикер берет на себя задачу.
+            Если в тексте есть метки времени [ч:мм:сс], в разделах «Ключевые решения» и
+            «Действия и ответственные» заканчивай каждый пункт меткой ближайшего места, где это обсуждалось.
+            Текст встречи:
+            {text}
+            """
+
+CHUNK_PROMPT = """
+            Это фрагмент {index} из {total} транскрипта встречи.
+            Кратко перескажи его в виде списка фактов на русском языке.
+            Обязательно сохрани темы, принятые решения, поручения с именами ответственных
+            (или метками спикеров, если реплики ими помечены), сроки и договоренности о следующих шагах. Не добавляй того, чего нет в тексте.
+            Если в тексте есть метки времени [ч:мм:сс], заканчивай решения и поручения меткой ближайшего места, где они прозвучали.
+
+            Фрагмент встречи:
+            {text}
+            """
+
+MERGE_PROMPT = """
+            Объедини следующие конспекты частей одной встречи в один конспект,
+            убрав повторы и сохранив все решения, поручения и ответственных, а также их метки времени [ч:мм:сс].
+
+            {text}
+            """
+
+REDUCE_PROMPT = """
+            Ниже приведены конспекты последовательных частей одной встречи.
+            Создай на их основе подробное краткое содержание всей встречи в формате Markdown.
+            Включи следующие разделы:
+            {sections}
+            Если в конспектах указаны спикеры («Спикер 1» и т. п.), в разделе «Действия и ответственные»
+            указывай, какой спикер берет на себя задачу.
+            Если у решений и поручений есть метки времени [ч:мм:сс], сохраняй их в конце соответствующих пунктов.
+            Конспекты частей встречи:
+            {text}
+            """
+
+LIVE_UPDATE_PROMPT = """
+            Ниже текущее краткое содержание идущей встречи и новый фрагмент ее транскрипта.
+            Обнови краткое содержание с учетом нового фрагмента: дополни и уточни разделы,
+            ничего не теряя из уже записанного. Ответ — полное обновленное краткое содержание
+            в формате Markdown со следующими разделами:
+            {sections}
+            Текущее краткое содержание:
+            {summary}
+
+            Новый фрагмент встречи:
+            {text}
+            """
+
+# Режим сервиса
+SERVICE_MAX_QUEUED = 32       # Сколько незавершенных заданий принимает сервис
+SERVICE_MAX_FINISHED = 256    # Сколько завершенных заданий сервис помнит для GET /jobs
+
+# Живой режим
+LIVE_WINDOW_SEC = 30          # Длина окна транскрибации потока
+LIVE_SUMMARY_MIN_CHARS = 3000 # Сколько нового текста накопить перед обновлением саммари
+LIVE_IDLE_TIMEOUT = 10        # Растущий файл считается законченным, если не растет столько секунд
+
+# Векторный индекс архива встреч
+INDEX_DIR = Path(os.environ.get("SUMMARIZER_INDEX_DIR", Path.home() / ".local" / "share" / "summarizer" / "index"))
+EMBED_MODEL = "bge-m3"        # Многоязычная модель эмбеддингов Ollama
+EMBED_BATCH = 32              # Сколько фрагментов отправлять в одном запросе эмбеддингов
+INDEX_PASSAGE_CHARS = 600     # Примерный размер индексируемого фрагмента транскрипта
+
+# Кэш транскриптов и саммари
+CACHE_DIR = Path(os.environ.get("SUMMARIZER_CACHE_DIR", Path.home() / ".cache" / "summarizer"))
+CACHE_MAX_MB = 2048           # Предел размера кэша; старые записи вытесняются (LRU)
+PREFLIGHT_TTL_SEC = 900       # Сколько секунд успешный результат --check считается актуальным
+PREFLIGHT_TIMEOUT = 0.5       # Таймаут запроса к Ollama при --check, с
+# Файлы моделей Whisper, имя которых не совпадает с именем модели
+WHISPER_MODEL_FILES = {"large": "large-v3.pt", "turbo": "large-v3-turbo.pt"}
 
 class Spinner:
     """Класс для отображения индикатора загрузки"""
+    # В пакетном режиме несколько стадий работают одновременно: анимируется только первый индикатор
+    _active_lock = threading.Lock()
+    _active = None
+
     def __init__(self, message="Загрузка..."):
         self.spinner = itertools.cycle(['-', '/', '|', '\\\\'])
         self.message = message
@@ -262,36 +668,472 @@ class Spinner:
             sys.stdout.flush()
 
     def __enter__(self):
+        with Spinner._active_lock:
+            if Spinner._active is not None:
+                return
+            Spinner._active = self
         self.running = True
-        self.thread = threading.Thread(target=self.spin)
+        self.thread = threading.Thread(target=self.spin, daemon=True)
         self.thread.start()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.thread is None:
+            return
         self.running = False
         self.thread.join()
+        self.thread = None
+        with Spinner._active_lock:
+            Spinner._active = None
         sys.stdout.write('\\r' + ' ' * (len(self.message) + 2) + '\\r')
         sys.stdout.flush()
 
+def peak_rss_bytes():
+    """Пиковый объем резидентной памяти процесса (и завершенных дочерних процессов) в байтах"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    # В Linux ru_maxrss в килобайтах, в macOS — в байтах
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own, children
+
+def format_duration(seconds):
+    """Форматирует длительность с точностью до миллисекунд: 0:01:02.345"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    return f"{hours}:{minutes:02d}:{millis // 1000:02d}.{millis % 1000:03d}"
+
+class Telemetry:
+    """
+    Трассировка этапов: вложенные интервалы (spans) по монотонным часам с атрибутами,
+    пиковой памятью и счетчиками токенов. Записи пишутся в JSON Lines, агрегаты
+    доступны в текстовом формате Prometheus.
+    """
+    def __init__(self):
+        self.run_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self.trace_path = None
+        self._file = None
+        self._lock = threading.Lock()
+        self._stack = contextvars.ContextVar("telemetry_spans", default=())
+        self._attrs = contextvars.ContextVar("telemetry_attrs", default={})
+        self._origin = time.monotonic()
+        self.stage_seconds = {}    # имя этапа -> [количество, сумма секунд]
+        self.counters = {}         # (имя, метки) -> значение
+
+    def open(self, trace_path):
+        """Начинает запись трассы в файл JSON Lines"""
+        self.trace_path = Path(trace_path)
+        self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.trace_path, "a", encoding="utf-8")
+        self.record({"type": "run_start", "argv": sys.argv, "pid": os.getpid()})
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def record(self, entry):
+        """Записывает одну строку трассы"""
+        entry = {"run_id": self.run_id, "ts": time.time(), **entry}
+        with self._lock:
+            if self._file:
+                self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\\n")
+                self._file.flush()
+
+    @contextlib.contextmanager
+    def bind(self, **attrs):
+        """Добавляет атрибуты (например, имя задания) ко всем интервалам в текущем контексте"""
+        token = self._attrs.set({**self._attrs.get(), **attrs})
+        try:
+            yield
+        finally:
+            self._attrs.reset(token)
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """Замеряет интервал; атрибуты можно дополнять через annotate() изнутри"""
+        span = {"name": name, "attrs": {**self._attrs.get(), **attrs}}
+        parents = self._stack.get()
+        if parents:
+            span["parent"] = parents[-1]["name"]
+        token = self._stack.set(parents + (span,))
+        start = time.monotonic()
+        status = "ok"
+        try:
+            yield span["attrs"]
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            duration = time.monotonic() - start
+            self._stack.reset(token)
+            rss, children_rss = peak_rss_bytes()
+            with self._lock:
+                count_sum = self.stage_seconds.setdefault(name, [0, 0.0])
+                count_sum[0] += 1
+                count_sum[1] += duration
+            self.record({
+                "type": "span",
+                "name": name,
+                "parent": span.get("parent"),
+                "start": round(start - self._origin, 6),
+                "duration": round(duration, 6),
+                "status": status,
+                "thread": threading.current_thread().name,
+                "peak_rss_bytes": rss,
+                "children_peak_rss_bytes": children_rss,
+                **span["attrs"],
+            })
+
+    def annotate(self, **attrs):
+        """Дополняет атрибуты текущего (самого вложенного) интервала"""
+        stack = self._stack.get()
+        if stack:
+            stack[-1]["attrs"].update(attrs)
+
+    def count(self, name, value=1, **labels):
+        """Увеличивает счетчик (например, токены LLM или число заданий)"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def prometheus_text(self):
+        """Возвращает метрики в текстовом формате Prometheus"""
+        lines = [
+            "# TYPE summarizer_stage_seconds summary",
+        ]
+        with self._lock:
+            for name, (count, total) in sorted(self.stage_seconds.items()):
+                lines.append(f'summarizer_stage_seconds_count{{stage="{name}"}} {count}')
+                lines.append(f'summarizer_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            for (name, labels), value in sorted(self.counters.items()):
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"summarizer_{name}{{{label_text}}} {value}")
+        rss, children_rss = peak_rss_bytes()
+        if rss is not None:
+            lines.append("# TYPE summarizer_peak_rss_bytes gauge")
+            lines.append(f"summarizer_peak_rss_bytes {rss}")
+            lines.append(f"summarizer_children_peak_rss_bytes {children_rss}")
+        lines.append(f"summarizer_uptime_seconds {time.monotonic() - self._origin:.3f}")
+        return "\\n".join(lines) + "\\n"
+
+    def serve_metrics(self, port, host="127.0.0.1"):
+        """Запускает фоновый HTTP-сервер с метриками Prometheus на /metrics"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+telemetry = Telemetry()
+
 def log_step_time(func):
-    """Декоратор для логирования времени выполнения функций"""
+    """Декоратор: замеряет этап как интервал трассы и выводит время с точностью до миллисекунд"""
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        elapsed = end_time - start_time
-        print(f"⏱️ Время выполнения '{func.__name__}': {timedelta(seconds=int(elapsed))}")
+        with telemetry.span(func.__name__):
+            start_time = time.monotonic()
+            result = func(*args, **kwargs)
+            elapsed = time.monotonic() - start_time
+        print(f"⏱️ Время выполнения '{func.__name__}': {format_duration(elapsed)}")
         return result
     return wrapper
 
+class TokenBudget:
+    """
+    Оценивает число токенов в запросе и подбирает под него num_ctx.
+    Оценка идет по длине текста; коэффициент уточняется по prompt_eval_count из ответов Ollama.
+    """
+    def __init__(self, chars_per_token=CHARS_PER_TOKEN):
+        self.chars_per_token = chars_per_token
+        self._lock = threading.Lock()
+
+    def estimate(self, text):
+        """Оценка числа токенов в тексте"""
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def observe(self, prompt, prompt_eval_count):
+        """Уточняет коэффициент по фактическому числу токенов запроса"""
+        if not prompt_eval_count or len(prompt) < 1000:
+            return
+        # Коэффициент только уменьшается: при совпадении префикса с кэшем Ollama считает
+        # не все токены запроса, и такие ответы занижали бы оценку
+        observed = len(prompt) / prompt_eval_count
+        with self._lock:
+            if observed < self.chars_per_token:
+                self.chars_per_token = observed
+
+    def num_ctx(self, prompt, output_tokens):
+        """
+        Контекст под запрос и ответ: степень двойки от NUM_CTX_MIN до NUM_CTX_MAX.
+        Смена num_ctx заставляет Ollama перезагрузить модель, поэтому размеров немного.
+        """
+        needed = self.estimate(prompt) * CONTEXT_MARGIN + output_tokens
+        size = NUM_CTX_MIN
+        while size < needed and size < NUM_CTX_MAX:
+            size *= 2
+        return size
+
+token_budget = TokenBudget()
+
+def estimate_tokens(text):
+    """Оценка числа токенов по начальному коэффициенту: деление на фрагменты не зависит от уточнений"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def set_read_timeout(response, timeout):
+    """Меняет таймаут чтения уже открытого потокового ответа requests (на сокете соединения)"""
+    try:
+        response.raw.connection.sock.settimeout(timeout)
+    except AttributeError:
+        # Соединение недоступно (другая версия urllib3): остается прежний таймаут
+        pass
+
+class OllamaClient:
+    """
+    Единый клиент Ollama для всех HTTP-вызовов: пул соединений (requests.Session),
+    повторы с экспоненциальной задержкой при ошибках соединения и 5xx, таймауты на каждый вызов
+    и общее для процесса ограничение числа одновременных генераций.
+    """
+    def __init__(self, base_url=OLLAMA_URL, max_concurrency=MAX_PARALLEL_REQUESTS,
+                 retries=OLLAMA_RETRIES, backoff=OLLAMA_RETRY_BACKOFF):
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        import requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(4, max_concurrency * 2))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def request(self, method, path, timeout=10, retries=None, **kwargs):
+        """
+        Выполняет запрос с повторами при ошибках соединения и ответах 5xx; поток ответа
+        (stream=True) не повторяется после начала чтения. Таймаут чтения не повторяется:
+        Ollama не шлет заголовки до первого токена, и повтор выбросил бы уже обработанный запрос.
+        """
+        import requests
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", timeout=timeout, **kwargs)
+                if response.status_code < 500 or attempt == retries:
+                    return response
+                response.close()
+            except requests.exceptions.ConnectionError:
+                # ConnectTimeout — подкласс ConnectionError и повторяется; ReadTimeout — нет
+                if attempt == retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def get(self, path, timeout=10, **kwargs):
+        return self.request("GET", path, timeout=timeout, **kwargs)
+
+    def post(self, path, timeout=10, **kwargs):
+        return self.request("POST", path, timeout=timeout, **kwargs)
+
+    def generate(self, prompt, model=None, num_ctx=None, on_token=None, stats=None, stall_timeout=None,
+                 output_tokens=CHUNK_OUTPUT_TOKENS):
+        """
+        Отправляет запрос генерации в Ollama в потоковом режиме и возвращает текст ответа.
+        Если num_ctx не задан, контекст подбирается по оценке длины запроса плюс output_tokens.
+        on_token вызывается для каждого полученного фрагмента, в stats записываются
+        время до первого токена и скорость генерации.
+        """
+        model = model or LLM_MODEL
+        stats = {} if stats is None else stats
+        num_ctx = num_ctx or token_budget.num_ctx(prompt, output_tokens)
+        with self._slots, telemetry.span("llm.generate", model=model, num_ctx=num_ctx, prompt_chars=len(prompt),
+                                         prompt_tokens_estimate=token_budget.estimate(prompt)):
+            # До первого токена модель загружается и читает весь запрос: это ожидание не считается зависанием
+            first_token_timeout = OLLAMA_LOAD_TIMEOUT + token_budget.estimate(prompt) / OLLAMA_MIN_PROMPT_RATE
+            text = self._generate(prompt, model, num_ctx, on_token, stats, first_token_timeout,
+                                  stall_timeout or OLLAMA_STALL_TIMEOUT)
+            token_budget.observe(prompt, stats.get("prompt_eval_count"))
+            telemetry.annotate(**stats)
+            telemetry.count("llm_prompt_tokens_total", stats.get("prompt_eval_count") or 0, model=model)
+            telemetry.count("llm_eval_tokens_total", stats.get("eval_count") or 0, model=model)
+            return text
+
+    def _generate(self, prompt, model, num_ctx, on_token, stats, first_token_timeout, stall_timeout):
+        import requests
+        start = time.monotonic()
+        # Таймаут чтения действует между порциями потока: до первого токена он равен
+        # first_token_timeout, после — stall_timeout, так что зависание обнаруживается
+        # через stall_timeout без ответа, а не через часы общего ожидания
+        timeout = first_token_timeout
+        try:
+            response = self.post(
+                "/api/generate",
+                json={
+                    "model": model,
+                    "prompt": prompt,
+                    "stream": True,
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
+                    "options": {**LLM_OPTIONS, "num_ctx": num_ctx}
+                },
+                stream=True,
+                timeout=(10, first_token_timeout),
+            )
+        except requests.exceptions.ReadTimeout as e:
+            raise TimeoutError(f"Ollama не начала отвечать за {first_token_timeout:.0f} с: {e}") from e
+        with response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama вернула {response.status_code}: {response.text}")
+
+            parts = []
+            first_token_at = None
+            final = {}
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise RuntimeError(f"Ollama вернула ошибку: {chunk['error']}")
+                    token = chunk.get("response", "")
+                    if token:
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                            timeout = stall_timeout
+                            set_read_timeout(response, stall_timeout)
+                        parts.append(token)
+                        if on_token:
+                            on_token(token)
+                    if chunk.get("done"):
+                        final = chunk
+                        break
+            except requests.exceptions.ConnectionError as e:
+                # Истечение таймаута чтения в потоке requests сообщает как ConnectionError
+                raise TimeoutError(f"Ollama не отвечает дольше {timeout:.0f} с: {e}") from e
+
+        if not final:
+            raise RuntimeError("Поток Ollama оборвался до завершения генерации")
+
+        elapsed = time.monotonic() - start
+        eval_count = final.get("eval_count", len(parts))
+        eval_seconds = final.get("eval_duration", 0) / 1e9 or (elapsed - ((first_token_at or start) - start))
+        stats.update({
+            "time_to_first_token": (first_token_at - start) if first_token_at else None,
+            "total_time": elapsed,
+            "prompt_eval_count": final.get("prompt_eval_count"),
+            "eval_count": eval_count,
+            "tokens_per_second": eval_count / eval_seconds if eval_seconds > 0 else None,
+        })
+        return "".join(parts)
+
+    async def agenerate(self, prompt, **kwargs):
+        """Асинхронная генерация; число одновременных запросов ограничено max_concurrency"""
+        import asyncio
+        return await asyncio.to_thread(self.generate, prompt, **kwargs)
+
+    async def agenerate_many(self, prompts, **kwargs):
+        """Асинхронно генерирует ответы на несколько запросов, сохраняя порядок"""
+        import asyncio
+        return await asyncio.gather(*(self.agenerate(prompt, **kwargs) for prompt in prompts))
+
+    def generate_many(self, prompts, **kwargs):
+        """Синхронная обертка над agenerate_many для вызова из обычного кода"""
+        import asyncio
+        return asyncio.run(self.agenerate_many(prompts, **kwargs))
+
+    def embed(self, texts, model=None):
+        """Возвращает эмбеддинги списка текстов (эндпоинт /api/embed)"""
+        model = model or EMBED_MODEL
+        with self._slots, telemetry.span("llm.embed", model=model, texts=len(texts)):
+            response = self.post("/api/embed", json={"model": model, "input": texts, "keep_alive": OLLAMA_KEEP_ALIVE},
+                                 timeout=(10, OLLAMA_STALL_TIMEOUT))
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama вернула {response.status_code}: {response.text}")
+            return response.json()["embeddings"]
+
+_ollama_client = None
+_ollama_client_lock = threading.Lock()
+
+def get_ollama_client():
+    """Возвращает общий для процесса клиент Ollama"""
+    global _ollama_client
+    with _ollama_client_lock:
+        if _ollama_client is None:
+            _ollama_client = OllamaClient()
+        return _ollama_client
+
+def ollama_generate(prompt, output_tokens=SUMMARY_OUTPUT_TOKENS, on_token=None, stats=None, num_ctx=None):
+    """Генерирует ответ LLM через общий клиент Ollama; без num_ctx контекст подбирается под запрос и output_tokens"""
+    return get_ollama_client().generate(prompt, output_tokens=output_tokens, on_token=on_token, stats=stats,
+                                        num_ctx=num_ctx)
+
+def ollama_generate_many(prompts, output_tokens=CHUNK_OUTPUT_TOKENS, checkpoints=None, num_ctx=None):
+    """
+    Генерирует ответы на несколько запросов параллельно через общий клиент Ollama.
+    С checkpoints каждый ответ сохраняется сразу по готовности, а уже сохраненные не запрашиваются повторно.
+    """
+    import asyncio
+    client = get_ollama_client()
+    if checkpoints is None:
+        return client.generate_many(prompts, output_tokens=output_tokens, num_ctx=num_ctx)
+
+    def generate_one(prompt):
+        key = hash_key("llm", LLM_MODEL, LLM_OPTIONS, prompt)
+        saved = checkpoints.get("llm", key)
+        if saved is not None:
+            return saved["response"]
+        response = client.generate(prompt, output_tokens=output_tokens, num_ctx=num_ctx)
+        checkpoints.put("llm", key, {"response": response})
+        return response
+
+    async def generate_all():
+        return await asyncio.gather(*(asyncio.to_thread(generate_one, prompt) for prompt in prompts))
+    return asyncio.run(generate_all())
+
 @log_step_time
 def check_ollama_server():
     """Проверяет, запущен ли сервер Ollama"""
+    return ollama_is_up(timeout=10)
+
+def ollama_is_up(timeout=1):
+    """Быстрая проверка доступности сервера Ollama без логирования"""
+    import requests
     try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=10)
+        response = get_ollama_client().get("/api/tags", timeout=timeout, retries=0)
         return response.status_code == 200
-    except requests.exceptions.ConnectionError:
+    except requests.exceptions.RequestException:
         return False
 
+def wait_for_ollama(deadline_sec=OLLAMA_START_TIMEOUT, process=None):
+    """Ждет готовности сервера, опрашивая его с нарастающим интервалом (0.1 с ... 2 с)"""
+    delay = 0.1
+    deadline = time.monotonic() + deadline_sec
+    while time.monotonic() < deadline:
+        if ollama_is_up():
+            return True
+        if process is not None and process.poll() is not None:
+            return False  # Процесс сервера завершился, ждать бессмысленно
+        time.sleep(delay)
+        delay = min(delay * 1.5, 2)
+    return False
+
 @log_step_time
 def start_ollama_server():
     """Запускает сервер Ollama в фоновом режиме"""
@@ -303,13 +1145,9 @@ def start_ollama_server():
                 stderr=subprocess.DEVNULL,
                 start_new_session=True
             )
-            time.sleep(5)
-            
-            for _ in range(10):
-                if check_ollama_server():
-                    print("✅ Сервер Ollama успешно запущен")
-                    return process
-                time.sleep(2)
+            if wait_for_ollama(process=process):
+                print("✅ Сервер Ollama успешно запущен")
+                return process
         
         print("❌ Не удалось запустить сервер Ollama")
         return None
@@ -318,164 +1156,2412 @@ def start_ollama_server():
         return None
 
 @log_step_time
-def ensure_gemma_model():
-    """Убеждается, что модель Gemma 3 27B доступна"""
+def ensure_llm_model(model=None):
+    """Убеждается, что модель (по умолчанию LLM_MODEL) доступна в Ollama, и загружает ее при необходимости"""
+    model = model or LLM_MODEL
     try:
-        with Spinner("🔍 Проверяем наличие модели Gemma 3 27B..."):
-            response = requests.get("http://localhost:11434/api/tags")
+        with Spinner(f"🔍 Проверяем наличие модели {model}..."):
+            response = get_ollama_client().get("/api/tags", timeout=30)
             models = response.json().get("models", [])
             
-            gemma_models = [m for m in models if "gemma3" in m.get("name", "").lower() and "27b" in m.get("name", "")]
-            
-            if not gemma_models:
-                print("📥 Модель Gemma 3 27B не найдена, начинаем загрузку...")
-                subprocess.run(["ollama", "pull", "gemma3:27b"], check=True)
-                print("✅ Модель Gemma 3 27B успешно загружена")
+            # Модель без тега Ollama хранит как <имя>:latest
+            wanted = model if ":" in model else f"{model}:latest"
+            if not any(m.get("name") == wanted for m in models):
+                print(f"📥 Модель {model} не найдена, начинаем загрузку...")
+                subprocess.run(["ollama", "pull", model], check=True)
+                print(f"✅ Модель {model} успешно загружена")
             else:
-                print("✅ Модель Gemma 3 27B уже доступна")
+                print(f"✅ Модель {model} уже доступна")
                 
         return True
     except Exception as e:
         print(f"❌ Ошибка при проверке/загрузке модели: {e}")
         return False
 
-@log_step_time
-def transcribe_audio(audio_path):
-    """Транскрибирует аудио с помощью Whisper large-v3"""
+def preload_llm():
+    """
+    Загружает модель в память Ollama заранее (пустой запрос с keep_alive).
+    Прогрев идет с тем же num_ctx, что и map-стадия длинной записи: такое задание найдет
+    модель готовой, а короткое перезагрузит ее с меньшим контекстом под свой запрос.
+    """
+    import requests
     try:
-        with Spinner("🎙️ Транскрибируем аудио с помощью Whisper large-v3..."):
-            # Используем Whisper для транскрибации
-            result = subprocess.run([
-                "whisper", audio_path, 
-                "--model", "large-v3",
-                "--language", "ru",
-                "--output_format", "txt"
-            ], capture_output=True, text=True, check=True)
-            
-            # Читаем результат из файла
-            base_name = Path(audio_path).stem
-            txt_path = f"{base_name}.txt"
-            with open(txt_path, 'r', encoding='utf-8') as f:
-                transcript = f.read()
-        
-        print("✅ Транскрибация завершена")
-        return transcript, txt_path
-    except Exception as e:
-        print(f"❌ Неожиданная ошибка при транскрибации: {e}")
-        return None, None
+        response = get_ollama_client().post(
+            "/api/generate",
+            json={"model": LLM_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE,
+                  "options": {**LLM_OPTIONS, "num_ctx": map_stage_num_ctx()}},
+            timeout=60*30,
+        )
+        return response.status_code == 200
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️ Не удалось заранее загрузить модель {LLM_MODEL}: {e}")
+        return False
 
-@log_step_time
-def summarize_text(text):
-    """Создает краткое содержание текста с помощью Ollama и Gemma 3 27B"""
+def unload_llm():
+    """Просит Ollama выгрузить модель из памяти (keep_alive=0)"""
+    import requests
     try:
-        with Spinner("🧠 Создаем краткое содержание с помощью Gemma 3 27B..."):
-            prompt = f"""
-            Создай подробное краткое содержание следующего текста встречи в формате Markdown.
-            Включи следующие разделы:
-            - Основные темы обсуждения
-            - Ключевые решения
-            - Действия и ответственные
-            - Следующие шаги
-            - Общая тональность встречи
-            
-            Текст встречи:
-            {text[:12000]}
-            """
-            
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": "gemma3:27b",
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "top_p": 0.9,
-                        "num_ctx": 8192  # Размер контекста
-                    }
-                },
-                timeout=60*60*3  # Увеличиваем таймаут для больших текстов
+        response = get_ollama_client().post(
+            "/api/generate",
+            json={"model": LLM_MODEL, "keep_alive": 0},
+            timeout=60,
+            retries=0,
+        )
+        return response.status_code == 200
+    except requests.exceptions.RequestException:
+        # Сервер еще не запущен — значит, и модель не загружена. Без повторов:
+        # ожидание запуска сервера задержало бы транскрибацию, которая ждет этого вызова
+        return False
+
+class OllamaWarmup:
+    """
+    Фоновая подготовка LLM: запуск сервера, проверка/загрузка модели и ее прогрев.
+    Выполняется параллельно с транскрибацией, чтобы к готовности транскрипта модель была в памяти.
+    С preload=False модель не прогревается: при нехватке памяти ее загрузит планировщик в свою очередь.
+    С check_model=False наличие модели не проверяется (его уже подтвердил --check).
+    """
+    def __init__(self, preload=True, check_model=True):
+        self.preload = preload
+        self.check_model = check_model
+        self.process = None
+        self.ok = False
+        self.error = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            if not check_ollama_server():
+                self.process = start_ollama_server()
+                if not self.process:
+                    self.error = "Не удалось запустить Ollama. Убедитесь, что Ollama установлен."
+                    return
+            if self.check_model and not ensure_llm_model():
+                self.error = f"Не удалось загрузить модель {LLM_MODEL}"
+                return
+            if self.preload and preload_llm():
+                print(f"🔥 Модель {LLM_MODEL} загружена в память и готова")
+            self.ok = True
+        except Exception as e:
+            self.error = f"Ошибка подготовки Ollama: {e}"
+        finally:
+            if self.error:
+                print(f"❌ {self.error}")
+            self._done.set()
+
+    def wait(self):
+        """Блокирует до окончания подготовки и возвращает True, если LLM готова"""
+        self._done.wait()
+        return self.ok
+
+def hash_file(path, block_size=1024 * 1024):
+    """Считает SHA-256 содержимого файла потоково"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_key(*parts):
+    """Строит ключ кэша из произвольных JSON-сериализуемых частей"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    Дисковый кэш с адресацией по содержимому: transcripts/<ключ>.json и summaries/<ключ>.json.
+    Время доступа хранится в mtime файла; при превышении предела вытесняются давно не используемые записи.
+    """
+    def __init__(self, root=CACHE_DIR, max_mb=CACHE_MAX_MB, read=True, write=True):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb is not None else None
+        self.read = read
+        self.write = write
+        self._lock = threading.Lock()
+
+    def _path(self, namespace, key):
+        return self.root / namespace / f"{key}.json"
+
+    def get(self, namespace, key):
+        """Возвращает сохраненное значение или None"""
+        if not self.read:
+            return None
+        path = self._path(namespace, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # Отмечаем использование для LRU
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def put(self, namespace, key, value):
+        """Атомарно сохраняет значение и при необходимости вытесняет старые записи"""
+        if not self.write:
+            return
+        path = self._path(namespace, key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            if self.max_bytes is not None:
+                self.evict()
+        except OSError as e:
+            print(f"⚠️ Не удалось записать кэш {path}: {e}")
+
+    def clear(self):
+        """Удаляет все записи"""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def evict(self):
+        """Удаляет самые давно использованные записи, пока кэш не уложится в предел"""
+        with self._lock:
+            entries = []
+            for path in self.root.glob("*/*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                except OSError:
+                    pass
+
+def open_checkpoints(job_dir):
+    """Контрольные точки задания: готовые отрезки транскрипта и ответы LLM (без ограничения размера)"""
+    return ResultCache(Path(job_dir) / "checkpoints", max_mb=None)
+
+def transcript_cache_key(audio_path, engine, diarize=False, num_speakers=None, trim_silence=False, normalize=False):
+    """Ключ транскрипта: содержимое аудио, модель Whisper, язык, параметры диаризации и предобработки"""
+    parts = ["transcript", hash_file(audio_path), engine.model_name, engine.language]
+    if diarize:
+        parts.append({"diarize": True, "num_speakers": num_speakers})
+    if trim_silence or normalize:
+        parts.append({"trim_silence": trim_silence, "normalize": normalize})
+    return hash_key(*parts)
+
+def summary_cache_key(text):
+    """Ключ саммари: содержимое транскрипта, модель LLM, шаблоны запросов и параметры"""
+    return hash_key(
+        "summary",
+        hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        LLM_MODEL,
+        [SUMMARY_SECTIONS, SUMMARY_PROMPT, CHUNK_PROMPT, MERGE_PROMPT, REDUCE_PROMPT],
+        {**LLM_OPTIONS, "chars_per_token": CHARS_PER_TOKEN, "chunk_tokens": CHUNK_TOKENS, "chunk_overlap": CHUNK_OVERLAP},
+    )
+
+class WhisperEngine:
+    """Резидентный движок транскрибации: модель Whisper загружается один раз на процесс"""
+    instances = weakref.WeakSet()   # Все движки процесса: планировщик памяти выгружает их модели
+
+    def __init__(self, model_name=None, language=WHISPER_LANGUAGE, device=None):
+        self.model_name = model_name or WHISPER_MODEL
+        self.language = language
+        self.device = device
+        self.model = None
+        self._lock = threading.Lock()
+        WhisperEngine.instances.add(self)
+
+    def load(self):
+        """Загружает модель при первом обращении и возвращает ее"""
+        with self._lock:
+            if self.model is None:
+                import whisper  # Тяжелый импорт (torch) выполняем только при реальной загрузке
+                self.model = whisper.load_model(self.model_name, device=self.device)
+                self.device = str(self.model.device)
+        return self.model
+
+    def unload(self):
+        """Освобождает память модели; при следующей транскрибации она загрузится заново"""
+        with self._lock:
+            if self.model is None:
+                return
+            self.model = None
+        gc.collect()
+        if self.device and self.device.startswith("cuda"):
+            import torch
+            torch.cuda.empty_cache()
+
+    def transcribe(self, audio, **options):
+        """Транскрибирует путь к файлу или массив PCM 16 кГц и возвращает текст и сегменты"""
+        model = self.load()
+        # Модель не потокобезопасна: один вызов декодирования за раз на экземпляр
+        with self._lock:
+            result = model.transcribe(
+                audio,
+                language=self.language,
+                fp16=self.device.startswith("cuda"),
+                verbose=None,
+                **options,
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                summary = result.get("response", "")
-                print("✅ Саммаризация завершена")
-                return summary
-            else:
-                print(f"❌ Ошибка саммаризации: {response.text}")
-                return None
+        segments = [
+            {"start": seg["start"], "end": seg["end"], "text": seg["text"].strip()}
+            for seg in result.get("segments", [])
+        ]
+        return {
+            "text": "\\n".join(seg["text"] for seg in segments),
+            "segments": segments,
+            "language": result.get("language", self.language),
+        }
 
-    except Exception as e:
-        print(f"❌ Неожиданная ошибка при саммаризации: {e}")
+_whisper_engine = None
+
+def get_whisper_engine():
+    """Возвращает общий для процесса экземпляр WhisperEngine"""
+    global _whisper_engine
+    if _whisper_engine is None:
+        _whisper_engine = WhisperEngine()
+    return _whisper_engine
+
+def probe_total_memory_gb():
+    """Возвращает объем оперативной памяти в ГБ или None, если определить не удалось"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**3
+    except (ValueError, OSError, AttributeError):
         return None
 
-@log_step_time
-def save_markdown(summary, output_path):
-    """Сохраняет результат в Markdown файл"""
+def memory_budget_gb(memory_gb=None):
+    """Память, доступная моделям: --memory-gb как есть или весь объем ОЗУ за вычетом MEMORY_RESERVE_GB"""
+    if memory_gb:
+        return memory_gb
+    total_gb = probe_total_memory_gb()
+    return total_gb - MEMORY_RESERVE_GB if total_gb else None
+
+def auto_segment_workers(memory_gb=None):
+    """
+    Подбирает число процессов сегментной транскрибации по ядрам и бюджету памяти.
+    Вызывается после выбора профиля: размер копии модели берется из WHISPER_MEMORY_GB.
+    """
+    cores = os.cpu_count() or 1
+    workers = max(1, cores // SEGMENT_THREADS_PER_WORKER)
+    memory_gb = memory_budget_gb(memory_gb)
+    if memory_gb:
+        # Каждый процесс держит свою копию модели
+        workers = min(workers, max(1, int(memory_gb // WHISPER_MEMORY_GB)))
+    return workers
+
+def probe_gpu_memory_gb():
+    """Объем памяти самой большой видеокарты NVIDIA в ГБ или None, если ее нет"""
+    if not shutil.which("nvidia-smi"):
+        return None
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(summary)
-        print(f"✅ Результат сохранен в файл: {output_path}")
-        return True
-    except Exception as e:
-        print(f"❌ Ошибка при сохранении файла: {e}")
-        return False
+        output = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=10, check=True,
+        ).stdout
+        return max(float(line) for line in output.split()) / 1024
+    except (subprocess.SubprocessError, ValueError, OSError):
+        return None
 
-def main():
-    script_start_time = time.time()
-    print("🚀 Начало процесса обработки аудио\\n")
+def probe_audio_duration(audio_path):
+    """Длительность записи в секундах по данным ffprobe или None"""
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(audio_path)],
+            capture_output=True, text=True, timeout=30, check=True,
+        ).stdout
+        return float(output.strip())
+    except (subprocess.SubprocessError, ValueError, OSError):
+        return None
 
-    if len(sys.argv) < 2:
-        print("❌ Укажите путь к аудиофайлу в качестве аргумента.")
-        print("   Пример: python summarize.py audio.m4a")
-        sys.exit(1)
-    
-    audio_path = sys.argv[1]
-    if not os.path.exists(audio_path):
-        print(f"❌ Аудиофайл {audio_path} не найден")
+def estimate_processing_seconds(tier, audio_seconds, cores, gpu_memory_gb=None):
+    """
+    Грубая оценка времени обработки записи на профиле: транскрибация плюс обработка
+    запросов и генерация LLM. Скорости из MODEL_TIERS масштабируются по числу ядер,
+    на видеокарте (если модель в нее помещается) умножаются на GPU_SPEEDUP.
+    """
+    cpu_scale = REFERENCE_CORES / max(1, cores)
+    whisper_scale = 1 / GPU_SPEEDUP if gpu_memory_gb and gpu_memory_gb >= tier["whisper_gb"] else cpu_scale
+    llm_scale = 1 / GPU_SPEEDUP if gpu_memory_gb and gpu_memory_gb >= tier["llm_gb"] else cpu_scale
+
+    transcript_tokens = audio_seconds * SPEECH_TOKENS_PER_SEC
+    chunks = max(1, math.ceil(transcript_tokens / CHUNK_TOKENS))
+    # Ответы обычно занимают около половины зарезервированного под них контекста
+    output_tokens = (chunks * CHUNK_OUTPUT_TOKENS + SUMMARY_OUTPUT_TOKENS) / 2
+    llm_seconds = transcript_tokens / (tier["llm_tps"] * PROMPT_EVAL_SPEEDUP) + output_tokens / tier["llm_tps"]
+    return audio_seconds * tier["whisper_rtf"] * whisper_scale + llm_seconds * llm_scale
+
+def choose_model_tier(profile="auto", audio_seconds=None, deadline_seconds=None, memory_gb=None):
+    """
+    Выбирает профиль моделей. Явный профиль возвращается как есть; в режиме auto выбирается
+    самый качественный профиль, который помещается в память и успевает к сроку
+    (по умолчанию — за AUTO_TARGET_RTF от длительности записи).
+    Возвращает (имя профиля, описание выбора).
+    """
+    if profile != "auto":
+        return profile, "задан явно"
+
+    cores = os.cpu_count() or 1
+    memory_gb = memory_budget_gb(memory_gb)
+    gpu_memory_gb = probe_gpu_memory_gb()
+    # Длительность неизвестна (поток, сервис): сравниваем профили по часовой записи
+    seconds = audio_seconds or 3600
+    deadline = deadline_seconds or seconds * AUTO_TARGET_RTF
+
+    hardware = f"ядер: {cores}" + (f", память для моделей {memory_gb:.0f} ГБ" if memory_gb else "")
+    if gpu_memory_gb:
+        hardware += f", GPU {gpu_memory_gb:.0f} ГБ"
+    # Модели работают по очереди (см. ModelScheduler), поэтому в память должна поместиться большая из них
+    fitting = [
+        name for name in ("quality", "balanced", "fast")
+        if not memory_gb or max(MODEL_TIERS[name]["whisper_gb"], MODEL_TIERS[name]["llm_gb"]) <= memory_gb
+    ]
+    if not fitting:
+        return "fast", f"{hardware}; памяти мало даже для самого легкого профиля"
+    for name in fitting:
+        estimate = estimate_processing_seconds(MODEL_TIERS[name], seconds, cores, gpu_memory_gb)
+        if estimate <= deadline:
+            return name, f"{hardware}; оценка {format_duration(estimate)} при сроке {format_duration(deadline)}"
+    return "fast", f"{hardware}; ни один профиль не успевает к сроку {format_duration(deadline)}, выбран самый быстрый"
+
+def apply_model_tier(name):
+    """Переключает модели и их оценки памяти на выбранный профиль"""
+    global WHISPER_MODEL, LLM_MODEL, WHISPER_MEMORY_GB, LLM_MEMORY_GB
+    tier = MODEL_TIERS[name]
+    WHISPER_MODEL = tier["whisper"]
+    LLM_MODEL = tier["llm"]
+    WHISPER_MEMORY_GB = tier["whisper_gb"]
+    LLM_MEMORY_GB = tier["llm_gb"]
+    return tier
+
+def frame_energy_db(audio, frame, block_frames=20000):
+    """Энергия кадров в дБ; считается блоками, чтобы не создавать копию многочасового буфера"""
+    import numpy as np
+    n_frames = len(audio) // frame
+    energy = np.empty(n_frames, dtype=np.float32)
+    for start in range(0, n_frames, block_frames):
+        end = min(start + block_frames, n_frames)
+        frames = np.asarray(audio[start * frame:end * frame], dtype=np.float32).reshape(end - start, frame)
+        energy[start:end] = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    return energy
+
+def find_silences(audio, min_silence_sec, sample_rate=SAMPLE_RATE):
+    """Простая энергетическая VAD: возвращает паузы не короче min_silence_sec как пары (начало, конец) в отсчетах"""
+    import numpy as np
+    frame = int(sample_rate * 0.03)
+    energy_db = frame_energy_db(audio, frame)
+    if len(energy_db) == 0:
+        return []
+    # Порог относительно громкости речи, а не абсолютный: записи бывают очень тихими
+    threshold = np.percentile(energy_db, 95) - SILENCE_THRESHOLD_DB
+    silent = energy_db < threshold
+
+    silences = []
+    min_frames = int(min_silence_sec / 0.03)
+    run_start = None
+    for i, is_silent in enumerate(np.append(silent, False)):
+        if is_silent and run_start is None:
+            run_start = i
+        elif not is_silent and run_start is not None:
+            if i - run_start >= min_frames:
+                silences.append((run_start * frame, i * frame))
+            run_start = None
+    return silences
+
+def find_speech_cuts(audio, sample_rate=SAMPLE_RATE):
+    """Возвращает середины пауз (в отсчетах), пригодные для разреза"""
+    return [(start + end) // 2 for start, end in find_silences(audio, MIN_SILENCE_SEC, sample_rate)]
+
+def split_audio_on_silence(audio, target_sec, sample_rate=SAMPLE_RATE):
+    """Делит аудио на отрезки около target_sec секунд, разрезая только в паузах (не длиннее MAX_SEGMENT_SEC)"""
+    total = len(audio)
+    target = int(target_sec * sample_rate)
+    limit = int(MAX_SEGMENT_SEC * sample_rate)
+    shortest = min(target, int(MIN_SEGMENT_SEC * sample_rate))
+    cuts = find_speech_cuts(audio, sample_rate)
+
+    bounds = []
+    start = 0
+    cut_index = 0
+    while total - start > target:
+        # Пропускаем паузы, до которых отрезок получится короче target,
+        # запоминая последнюю из них, после которой отрезок не короче MIN_SEGMENT_SEC
+        fallback = None
+        while cut_index < len(cuts) and cuts[cut_index] - start < target:
+            if cuts[cut_index] - start >= shortest:
+                fallback = cuts[cut_index]
+            cut_index += 1
+        if cut_index < len(cuts) and cuts[cut_index] - start <= limit:
+            end = cuts[cut_index]
+            cut_index += 1
+        elif total - start <= limit:
+            break
+        elif fallback is not None:
+            # Между target и MAX_SEGMENT_SEC пауз нет: режем в последней паузе перед target
+            end = fallback
+        else:
+            # Пауз нет слишком долго: режем принудительно
+            end = start + limit
+        if total - end < sample_rate:
+            break
+        bounds.append((start, end))
+        start = end
+    bounds.append((start, total))
+    return bounds
+
+_segment_engine = None
+
+def _init_segment_worker(model_name, language, threads):
+    """Инициализатор процесса пула: ограничивает потоки torch и загружает модель один раз"""
+    global _segment_engine
+    import torch
+    torch.set_num_threads(threads)
+    _segment_engine = WhisperEngine(model_name, language, device="cpu")
+    _segment_engine.load()
+
+def _transcribe_segment(pcm_path, start, end):
+    """Транскрибирует один отрезок в процессе пула, читая его напрямую из общего PCM-файла"""
+    import numpy as np
+    audio = np.memmap(pcm_path, dtype=np.float32, mode="c")
+    return _segment_engine.transcribe(audio[start:end])
+
+_segment_pool = None
+
+def get_segment_pool(workers, engine=None):
+    """Возвращает общий пул процессов сегментной транскрибации (создается один раз на запуск)"""
+    global _segment_pool
+    if _segment_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        engine = engine or get_whisper_engine()
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # spawn, а не fork: к этому моменту в процессе уже работают потоки конвейера
+        # и может быть загружен torch, а fork копирует их блокировки в дочерний процесс
+        _segment_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_segment_worker,
+            initargs=(engine.model_name, engine.language, threads),
+        )
+        _segment_pool.workers = workers
+    return _segment_pool
+
+def shutdown_segment_pool():
+    """Останавливает пул процессов сегментной транскрибации"""
+    global _segment_pool
+    if _segment_pool is not None:
+        _segment_pool.shutdown()
+        _segment_pool = None
+
+def unload_whisper_models():
+    """Выгружает все загруженные модели Whisper, включая процессы сегментной транскрибации"""
+    for engine in list(WhisperEngine.instances):
+        engine.unload()
+    shutdown_segment_pool()
+
+class ModelScheduler:
+    """
+    Планировщик памяти для Whisper и LLM.
+    Если обе модели вместе с запасом не помещаются в память, они работают по очереди:
+    перед саммаризацией выгружается Whisper, перед транскрибацией Ollama выгружает LLM (keep_alive=0).
+    Модель остается в памяти, пока для нее есть работа в очереди, поэтому в пакетном режиме
+    задания группируются по моделям, а не чередуют их после каждого файла.
+    """
+    def __init__(self, budget_gb=None, footprints=None):
+        self.footprints = footprints or {"whisper": WHISPER_MEMORY_GB, "llm": LLM_MEMORY_GB}
+        budget_gb = memory_budget_gb(budget_gb)
+        self.budget_gb = budget_gb
+        # Если объем памяти неизвестен, надежнее не держать модели вместе
+        self.exclusive = budget_gb is None or sum(self.footprints.values()) > budget_gb
+        self.resident = None
+        self.swaps = 0
+        self._active = dict.fromkeys(self.footprints, 0)
+        self._demand = dict.fromkeys(self.footprints, 0)
+        self._swapping = False
+        self._cond = threading.Condition()
+
+    def describe(self):
+        models = " + ".join(f"{name} ~{size:g} ГБ" for name, size in self.footprints.items())
+        budget = f"{self.budget_gb:.0f} ГБ" if self.budget_gb else "неизвестно"
+        mode = "модели загружаются поочередно" if self.exclusive else "модели остаются в памяти вместе"
+        return f"🧮 Память для моделей: {budget}; {models}: {mode}"
+
+    def expect(self, model, count=1):
+        """Сообщает, что в очереди появилась работа для модели"""
+        with self._cond:
+            self._demand[model] += count
+            self._cond.notify_all()
+
+    def _can_run(self, model):
+        if self._swapping:
+            return False
+        if any(self._active[other] for other in self._active if other != model):
+            return False
+        # Загруженная модель уступает память, только когда для нее не осталось работы
+        return self.resident in (None, model) or self._demand[self.resident] == 0
+
+    @contextlib.contextmanager
+    def use(self, model):
+        """Контекст работы с моделью: при нехватке памяти дожидается своей очереди и выгружает другую"""
+        if not self.exclusive:
+            yield
+            return
+        with self._cond:
+            self._cond.wait_for(lambda: self._can_run(model))
+            swap = self.resident != model
+            if swap:
+                self._swapping = True
+            else:
+                self._acquire(model)
+        if swap:
+            try:
+                self._swap(self.resident, model)
+            finally:
+                with self._cond:
+                    self.resident = model
+                    self._swapping = False
+                    self._acquire(model)
+                    self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active[model] -= 1
+                self._cond.notify_all()
+
+    def _acquire(self, model):
+        self._active[model] += 1
+        self._demand[model] = max(0, self._demand[model] - 1)
+
+    def _swap(self, previous, model):
+        with telemetry.span("scheduler.swap", unload=previous, load=model):
+            if previous:
+                self.swaps += 1
+                telemetry.count("model_swaps_total", model=model)
+            if model == "llm":
+                if previous:
+                    print("🔄 Выгружаем Whisper из памяти перед саммаризацией")
+                unload_whisper_models()
+            else:
+                if previous:
+                    print(f"🔄 Выгружаем {LLM_MODEL} из памяти Ollama перед транскрибацией")
+                unload_llm()
+
+def piece_checkpoint_key(prepared, engine, start, end):
+    """Ключ контрольной точки отрезка: буфер, модель, язык и границы отрезка"""
+    return hash_key("piece", prepared.fingerprint, engine.model_name, engine.language, start, end)
+
+def stitch_pieces(bounds, results):
+    """Склеивает результаты отрезков, сдвигая таймкоды на начало каждого отрезка"""
+    segments = []
+    language = None
+    for (start, _), result in zip(bounds, results):
+        language = language or result["language"]
+        offset = start / SAMPLE_RATE
+        for seg in result["segments"]:
+            segments.append({"start": seg["start"] + offset, "end": seg["end"] + offset, "text": seg["text"]})
+    return {
+        "text": "\\n".join(seg["text"] for seg in segments),
+        "segments": segments,
+        "language": language,
+    }
+
+def transcribe_sequential(prepared, engine, checkpoints):
+    """
+    Транскрибирует буфер одним процессом по отрезкам около CHECKPOINT_PIECE_SEC,
+    сохраняя каждый готовый отрезок; при повторном запуске готовые отрезки пропускаются.
+    """
+    audio = prepared.audio
+    engine = engine or get_whisper_engine()
+    with telemetry.span("transcribe.vad_split") as span:
+        bounds = split_audio_on_silence(audio, CHECKPOINT_PIECE_SEC)
+        span["pieces"] = len(bounds)
+
+    keys = [piece_checkpoint_key(prepared, engine, start, end) for start, end in bounds]
+    results = [checkpoints.get("pieces", key) for key in keys]
+    done = sum(result is not None for result in results)
+    if done:
+        print(f"♻️ Продолжаем транскрибацию: готово {done} из {len(bounds)} отрезков")
+
+    with telemetry.span("transcribe.pieces", pieces=len(bounds), resumed=done):
+        previous_text = ""
+        for index, ((start, end), key) in enumerate(zip(bounds, keys)):
+            if results[index] is None:
+                # Хвост предыдущего отрезка сохраняет контекст Whisper на стыке
+                results[index] = engine.transcribe(audio[start:end], initial_prompt=previous_text[-200:] or None)
+                checkpoints.put("pieces", key, results[index])
+            previous_text = results[index]["text"]
+    return stitch_pieces(bounds, results)
+
+def transcribe_segmented(prepared, workers, engine=None, checkpoints=None):
+    """Режет запись по паузам, транскрибирует отрезки параллельно и склеивает их с исправленными таймкодами"""
+    audio = prepared.audio
+    engine = engine or get_whisper_engine()
+    pool = get_segment_pool(workers, engine)
+    duration = len(audio) / SAMPLE_RATE
+    # Отрезков в несколько раз больше, чем процессов, чтобы процессы не простаивали в конце
+    # Цель заметно меньше MAX_SEGMENT_SEC, чтобы до предела оставалось окно для поиска паузы
+    target_sec = min(MAX_SEGMENT_SEC * 0.8, max(MIN_SEGMENT_SEC, duration / (pool.workers * 3)))
+    with telemetry.span("transcribe.vad_split") as span:
+        bounds = split_audio_on_silence(audio, target_sec)
+        span["pieces"] = len(bounds)
+
+    keys = [piece_checkpoint_key(prepared, engine, start, end) for start, end in bounds]
+    results = [checkpoints.get("pieces", key) if checkpoints else None for key in keys]
+    done = sum(result is not None for result in results)
+    if done:
+        print(f"♻️ Продолжаем транскрибацию: готово {done} из {len(bounds)} отрезков")
+
+    with telemetry.span("transcribe.segments", workers=pool.workers, pieces=len(bounds), resumed=done):
+        # Процессам передаются только границы: каждый читает свой отрезок из того же PCM-файла
+        futures = {
+            index: pool.submit(_transcribe_segment, str(prepared.pcm_path), start, end)
+            for index, (start, end) in enumerate(bounds) if results[index] is None
+        }
+        for index, future in futures.items():
+            results[index] = future.result()
+            if checkpoints:
+                checkpoints.put("pieces", keys[index], results[index])
+    return stitch_pieces(bounds, results)
+
+class PreparedAudio:
+    """
+    Декодированная один раз запись: PCM 16 кГц моно float32 в файле, отображенном в память.
+    Все стадии читают один и тот же буфер без копирования. Если паузы вырезаны,
+    time_map позволяет пересчитать время обратно в шкалу исходной записи.
+    """
+    def __init__(self, pcm_path, time_map=None, fingerprint=None):
+        import numpy as np
+        self.pcm_path = Path(pcm_path)
+        self.fingerprint = fingerprint   # Хэш источника и параметров предобработки (для контрольных точек)
+        # mode="c": страницы читаются из файла по требованию, запись в массив не меняет файл
+        self.audio = np.memmap(self.pcm_path, dtype=np.float32, mode="c")
+        self.time_map = time_map or [(0, 0)]   # (отсчет в буфере, отсчет в исходной записи)
+
+    @property
+    def duration(self):
+        return len(self.audio) / SAMPLE_RATE
+
+    def to_original_time(self, seconds):
+        """Переводит время в буфере (после вырезания пауз) во время исходной записи"""
+        sample = seconds * SAMPLE_RATE
+        offset = 0
+        for buffer_start, original_start in self.time_map:
+            if buffer_start > sample:
+                break
+            offset = original_start - buffer_start
+        return (sample + offset) / SAMPLE_RATE
+
+    def remap_segments(self, segments):
+        """Возвращает сегменты с таймкодами исходной записи"""
+        if len(self.time_map) <= 1:
+            return segments
+        return [
+            {**seg, "start": self.to_original_time(seg["start"]), "end": self.to_original_time(seg["end"])}
+            for seg in segments
+        ]
+
+    def release(self, delete=True):
+        """
+        Отпускает буфер и (по умолчанию) удаляет PCM-файл. Отображение не закрывается вручную:
+        оно освободится, когда исчезнет последнее представление массива, поэтому стадии,
+        которые еще читают буфер, не упадут с ошибкой сегментации.
+        """
+        self.audio = None
+        if delete:
+            for path in (self.pcm_path, self.pcm_path.with_suffix(".json")):
+                with contextlib.suppress(OSError):
+                    path.unlink()
+
+def ffmpeg_decode(audio_path, pcm_path, normalize=False):
+    """Декодирует запись через ffmpeg прямо в файл сырого PCM float32 16 кГц моно"""
+    command = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-threads", "0", "-y",
+               "-i", str(audio_path), "-vn", "-ac", "1"]
+    if normalize:
+        # Выравнивание громкости по EBU R128: тихие участники не теряются на фоне громких
+        command += ["-af", "loudnorm=I=-16:TP=-1.5:LRA=11"]
+    command += ["-ar", str(SAMPLE_RATE), "-f", "f32le", "-acodec", "pcm_f32le", str(pcm_path)]
+    subprocess.run(command, check=True, capture_output=True)
+
+def trim_long_silences(pcm_path):
+    """
+    Вырезает паузы длиннее TRIM_MIN_SILENCE_SEC, оставляя по TRIM_KEEP_SEC с каждой стороны.
+    Возвращает карту времени [(отсчет в новом буфере, отсчет в исходной записи)].
+    """
+    import numpy as np
+    audio = np.memmap(pcm_path, dtype=np.float32, mode="r")
+    keep = int(TRIM_KEEP_SEC * SAMPLE_RATE)
+    # Оставляемые интервалы: все, кроме середин длинных пауз
+    intervals = []
+    position = 0
+    for start, end in find_silences(audio, TRIM_MIN_SILENCE_SEC):
+        if start + keep < end - keep:
+            intervals.append((position, start + keep))
+            position = end - keep
+    intervals.append((position, len(audio)))
+    if len(intervals) == 1:
+        return [(0, 0)]
+
+    trimmed_path = pcm_path.with_suffix(".trim")
+    time_map = []
+    written = 0
+    with open(trimmed_path, "wb") as f:
+        for start, end in intervals:
+            time_map.append((written, start))
+            # Копируем блоками, не загружая всю запись в память
+            for block_start in range(start, end, SAMPLE_RATE * 60):
+                f.write(audio[block_start:min(end, block_start + SAMPLE_RATE * 60)].tobytes())
+            written += end - start
+    del audio
+    os.replace(trimmed_path, pcm_path)
+    return time_map
+
+def preprocess_audio(audio_path, work_dir, trim_silence=False, normalize=False):
+    """
+    Стадия предобработки: одно декодирование ffmpeg в PCM, отображенный в память,
+    с необязательными выравниванием громкости и вырезанием длинных пауз.
+    Готовый буфер переиспользуется, пока не изменились запись и параметры.
+    """
+    pcm_path = Path(work_dir) / "audio.f32"
+    meta_path = pcm_path.with_suffix(".json")
+    stat = Path(audio_path).stat()
+    params = {"source": str(Path(audio_path).resolve()), "size": stat.st_size, "mtime": stat.st_mtime,
+              "trim_silence": trim_silence, "normalize": normalize, "sample_rate": SAMPLE_RATE}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["params"] == params and pcm_path.exists():
+            return PreparedAudio(pcm_path, [tuple(item) for item in meta["time_map"]], hash_key(params))
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with telemetry.span("preprocess.decode", normalize=normalize):
+        ffmpeg_decode(audio_path, pcm_path, normalize)
+    time_map = [(0, 0)]
+    if trim_silence:
+        with telemetry.span("preprocess.trim") as span:
+            original_samples = pcm_path.stat().st_size // 4
+            time_map = trim_long_silences(pcm_path)
+            span["trimmed_seconds"] = (original_samples - pcm_path.stat().st_size // 4) / SAMPLE_RATE
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "time_map": time_map}, f)
+    return PreparedAudio(pcm_path, time_map, hash_key(params))
+
+def write_wav(path, audio, sample_rate=SAMPLE_RATE):
+    """Сохраняет PCM float32 в 16-битный WAV (для инструментов, которым нужен файл)"""
+    import wave
+    import numpy as np
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        # Блоками по минуте: целиком в памяти оказывается только один блок, а не копия записи
+        for block_start in range(0, len(audio), sample_rate * 60):
+            block = audio[block_start:block_start + sample_rate * 60]
+            f.writeframes((np.clip(block, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+    return path
+
+def nemo_diarizer_config(manifest_path, out_dir, num_speakers=None):
+    """Конфигурация ClusteringDiarizer из NeMo: MarbleNet VAD + эмбеддинги TitaNet + кластеризация"""
+    from omegaconf import OmegaConf
+    return OmegaConf.create({
+        "device": None,
+        "num_workers": 0,
+        "sample_rate": SAMPLE_RATE,
+        "batch_size": 64,
+        "verbose": False,
+        "diarizer": {
+            "manifest_filepath": str(manifest_path),
+            "out_dir": str(out_dir),
+            "oracle_vad": False,
+            "collar": 0.25,
+            "ignore_overlap": True,
+            "vad": {
+                "model_path": "vad_multilingual_marblenet",
+                "external_vad_manifest": None,
+                "parameters": {
+                    "window_length_in_sec": 0.63, "shift_length_in_sec": 0.08, "smoothing": False,
+                    "overlap": 0.5, "onset": 0.8, "offset": 0.6, "pad_onset": 0.0, "pad_offset": 0.0,
+                    "min_duration_on": 0.2, "min_duration_off": 0.5, "filter_speech_first": True,
+                },
+            },
+            "speaker_embeddings": {
+                "model_path": "titanet_large",
+                "parameters": {
+                    "window_length_in_sec": [1.5, 1.25, 1.0, 0.75, 0.5],
+                    "shift_length_in_sec": [0.75, 0.625, 0.5, 0.375, 0.25],
+                    "multiscale_weights": [1, 1, 1, 1, 1],
+                    "save_embeddings": False,
+                },
+            },
+            "clustering": {
+                "parameters": {
+                    "oracle_num_speakers": bool(num_speakers),
+                    "max_num_speakers": DIARIZATION_MAX_SPEAKERS,
+                    "enhanced_count_thres": 80,
+                    "max_rp_threshold": 0.25,
+                    "sparse_search_volume": 30,
+                    "maj_vote_spk_count": False,
+                },
+            },
+        },
+    })
+
+def parse_rttm(path):
+    """Читает реплики спикеров из RTTM: [{"start", "end", "speaker"}] по времени"""
+    turns = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 8 and fields[0] == "SPEAKER":
+                start, duration = float(fields[3]), float(fields[4])
+                turns.append({"start": start, "end": start + duration, "speaker": fields[7]})
+    return sorted(turns, key=lambda turn: turn["start"])
+
+def diarize_audio(audio, work_dir, num_speakers=None):
+    """Определяет, кто и когда говорит, с помощью NeMo по уже декодированному аудио"""
+    from nemo.collections.asr.models import ClusteringDiarizer
+
+    work_dir = Path(work_dir) / "diarization"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    wav_path = write_wav(work_dir / "audio.wav", audio)
+    manifest_path = work_dir / "manifest.json"
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "audio_filepath": str(wav_path), "offset": 0, "duration": None, "label": "infer", "text": "-",
+            "num_speakers": num_speakers, "rttm_filepath": None, "uem_filepath": None,
+        }, f)
+        f.write("\\n")
+
+    with telemetry.span("diarize", num_speakers=num_speakers) as span:
+        diarizer = ClusteringDiarizer(cfg=nemo_diarizer_config(manifest_path, work_dir, num_speakers))
+        diarizer.diarize()
+        turns = parse_rttm(work_dir / "pred_rttms" / "audio.rttm")
+        span["speakers"] = len({turn["speaker"] for turn in turns})
+    return turns
+
+def assign_speakers(segments, turns):
+    """Назначает каждому сегменту Whisper спикера с наибольшим перекрытием по времени"""
+    labels = {}
+    for turn in turns:
+        labels.setdefault(turn["speaker"], f"Спикер {len(labels) + 1}")
+
+    result = []
+    first_turn = 0
+    for seg in segments:
+        overlaps = {}
+        # Реплики отсортированы: пропускаем закончившиеся до начала сегмента
+        while first_turn < len(turns) and turns[first_turn]["end"] <= seg["start"]:
+            first_turn += 1
+        for turn in turns[first_turn:]:
+            if turn["start"] >= seg["end"]:
+                break
+            overlap = min(seg["end"], turn["end"]) - max(seg["start"], turn["start"])
+            if overlap > 0:
+                overlaps[turn["speaker"]] = overlaps.get(turn["speaker"], 0) + overlap
+        speaker = labels[max(overlaps, key=overlaps.get)] if overlaps else None
+        result.append({**seg, "speaker": speaker})
+    return result
+
+def format_speaker_transcript(segments):
+    """Собирает текст с метками спикеров, объединяя подряд идущие сегменты одного спикера"""
+    lines = []
+    current = None
+    for seg in segments:
+        speaker = seg.get("speaker") or current or "Спикер ?"
+        if speaker == current and lines:
+            lines[-1] += " " + seg["text"]
+        else:
+            lines.append(f"{speaker}: {seg['text']}")
+            current = speaker
+    return "\\n".join(lines)
+
+def run_transcription(audio_path, output_dir, engine, segment_workers, diarize, num_speakers,
+                      trim_silence=False, normalize=False, keep_pcm=False, checkpoints=None):
+    """Декодирует запись один раз и запускает Whisper (и, при необходимости, диаризацию) на общем буфере"""
+    prepared = preprocess_audio(audio_path, output_dir, trim_silence, normalize)
+    succeeded = False
+    try:
+        result = transcribe_prepared(prepared, output_dir, engine, segment_workers, diarize, num_speakers,
+                                     checkpoints)
+        succeeded = True
+        return result
+    finally:
+        # После сбоя буфер оставляем: повторный запуск продолжит без повторного декодирования
+        prepared.release(delete=succeeded and not keep_pcm)
+
+def transcribe_prepared(prepared, output_dir, engine, segment_workers, diarize, num_speakers, checkpoints=None):
+    """Транскрибирует подготовленный буфер; таймкоды возвращаются в шкале исходной записи"""
+    audio = prepared.audio
+    diarization = None
+    if diarize:
+        # Диаризация идет в отдельном потоке одновременно с транскрибацией
+        diarization = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diarize")
+        turns_future = diarization.submit(
+            contextvars.copy_context().run, diarize_audio, audio, output_dir, num_speakers
+        )
+    try:
+        if segment_workers > 1:
+            result = transcribe_segmented(prepared, segment_workers, engine, checkpoints)
+        elif checkpoints:
+            result = transcribe_sequential(prepared, engine, checkpoints)
+        else:
+            result = engine.transcribe(audio)
+        result["segments"] = prepared.remap_segments(result["segments"])
+        result["duration"] = prepared.to_original_time(prepared.duration)
+
+        if diarize:
+            try:
+                turns = [
+                    {**turn, "start": prepared.to_original_time(turn["start"]), "end": prepared.to_original_time(turn["end"])}
+                    for turn in turns_future.result()
+                ]
+                result["segments"] = assign_speakers(result["segments"], turns)
+                result["text"] = format_speaker_transcript(result["segments"])
+            except Exception as e:
+                print(f"⚠️ Диаризация не удалась, транскрипт сохранен без спикеров: {e}")
+        return result
+    finally:
+        if diarization:
+            # После сбоя Whisper буфер освобождается сразу за выходом отсюда: не начатую диаризацию
+            # отменяем, а уже идущую дожидаемся, пока она читает буфер
+            diarization.shutdown(wait=True, cancel_futures=True)
+
+def segments_path_for(transcript_path):
+    """Путь к сегментам с таймкодами рядом с транскриптом <имя>.txt"""
+    transcript_path = Path(transcript_path)
+    return transcript_path.with_name(f"{transcript_path.stem}.segments.json")
+
+def load_segments(path):
+    """Читает сохраненные сегменты ({"language", "duration", "segments"}) или возвращает None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def format_clock(seconds):
+    """Метка времени вида ч:мм:сс"""
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def format_subtitle_time(seconds, separator):
+    """Время субтитра вида 00:01:02,345 (SRT) или 00:01:02.345 (VTT)"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+def segments_to_text(segments):
+    """Текст транскрипта: с метками спикеров, если сегменты ими размечены"""
+    if any(seg.get("speaker") for seg in segments):
+        return format_speaker_transcript(segments)
+    return "\\n".join(seg["text"] for seg in segments)
+
+def segments_to_srt(segments):
+    blocks = []
+    for index, seg in enumerate(segments, 1):
+        text = f"{seg['speaker']}: {seg['text']}" if seg.get("speaker") else seg["text"]
+        blocks.append(f"{index}\\n{format_subtitle_time(seg['start'], ',')} --> "
+                      f"{format_subtitle_time(seg['end'], ',')}\\n{text}\\n")
+    return "\\n".join(blocks)
+
+def segments_to_vtt(segments):
+    blocks = ["WEBVTT\\n"]
+    for seg in segments:
+        text = f"<v {seg['speaker']}>{seg['text']}" if seg.get("speaker") else seg["text"]
+        blocks.append(f"{format_subtitle_time(seg['start'], '.')} --> {format_subtitle_time(seg['end'], '.')}\\n{text}\\n")
+    return "\\n".join(blocks)
+
+TRANSCRIPT_FORMATS = {"txt": segments_to_text, "srt": segments_to_srt, "vtt": segments_to_vtt}
+
+def export_transcript(segments, base_path, formats):
+    """Записывает транскрипт в указанных форматах (<base_path>.<формат>) и возвращает пути файлов"""
+    paths = []
+    for name in formats:
+        path = Path(base_path).with_name(f"{Path(base_path).name}.{name}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(TRANSCRIPT_FORMATS[name](segments))
+        paths.append(path)
+    return paths
+
+def format_timed_transcript(segments, every=TIMESTAMP_EVERY_SEC):
+    """
+    Текст для LLM с метками времени [ч:мм:сс] не реже раза в every секунд и на каждой смене спикера:
+    по ним модель указывает, когда обсуждались решения и поручения.
+    """
+    lines = []
+    current = None
+    next_mark = 0.0
+    for seg in segments:
+        speaker = seg.get("speaker")
+        mark = f"[{format_clock(seg['start'])}] " if seg["start"] >= next_mark or speaker != current else ""
+        if mark:
+            next_mark = seg["start"] + every
+        if lines and speaker == current and not mark:
+            lines[-1] += " " + seg["text"]
+        else:
+            lines.append(mark + (f"{speaker}: " if speaker else "") + seg["text"])
+            current = speaker
+    return "\\n".join(lines)
+
+def link_timestamps(summary, audio_path, summary_dir, duration=None):
+    """Превращает метки [ч:мм:сс] в итоговом саммари в ссылки на запись с нужного места (#t=секунды)"""
+    target = quote(Path(os.path.relpath(Path(audio_path).resolve(), Path(summary_dir).resolve())).as_posix())
+
+    def replace(match):
+        hours, minutes, seconds = (int(part) for part in match.group(1).split(":"))
+        offset = hours * 3600 + minutes * 60 + seconds
+        if duration and offset > duration + 1:
+            return match.group(0)   # Метки вне записи модель придумала: ссылку не ставим
+        return f"[{match.group(1)}]({target}#t={offset})"
+
+    return re.sub(r"\\[(\\d+:\\d{2}:\\d{2})\\](?!\\()", replace, summary)
+
+def export_main(argv):
+    """Подкоманда export: форматы транскрипта из сохраненных сегментов, без повторной транскрибации"""
+    parser = argparse.ArgumentParser(
+        prog="summarize.py export",
+        description="Создает транскрипты в других форматах из сохраненных <имя>.segments.json",
+    )
+    parser.add_argument("roots", nargs="+", help="каталоги заданий или файлы .segments.json")
+    parser.add_argument("--formats", type=formats_arg, default=["srt", "vtt"],
+                        help="форматы через запятую: txt, srt, vtt (по умолчанию srt,vtt)")
+    args = parser.parse_args(argv)
+
+    sources = []
+    for root in map(Path, args.roots):
+        sources += [root] if root.is_file() else sorted(root.rglob("*.segments.json"))
+    if not sources:
+        print("❌ Не найдено ни одного файла .segments.json")
         sys.exit(1)
-    
-    # Проверяем и запускаем сервер Ollama
+    for source in sources:
+        data = load_segments(source)
+        if data is None:
+            print(f"❌ Не удалось прочитать {source}")
+            continue
+        base_path = source.with_name(source.name[:-len(".segments.json")])
+        for path in export_transcript(data["segments"], base_path, args.formats):
+            print(f"✅ {path}")
+
+def save_segments(path, segments, language=None, duration=None):
+    """Сохраняет сегменты с таймкодами рядом с транскриптом (по ним работает поиск по архиву)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"language": language, "duration": duration, "segments": segments}, f, ensure_ascii=False)
+
+@log_step_time
+def transcribe_audio(audio_path, output_dir=".", engine=None, segment_workers=0, cache=None,
+                     diarize=False, num_speakers=None, trim_silence=False, normalize=False, keep_pcm=False,
+                     checkpoints=None):
+    """
+    Транскрибирует аудио с помощью Whisper (модель остается загруженной в процессе).
+    При segment_workers > 1 запись режется по паузам и транскрибируется пулом процессов.
+    При diarize=True параллельно с Whisper работает диаризация NeMo, и транскрипт размечается по спикерам.
+    Запись один раз декодируется в PCM-файл в памяти; trim_silence и normalize управляют предобработкой.
+    С checkpoints готовые отрезки сохраняются, и прерванная транскрибация продолжается с места сбоя.
+    """
+    try:
+        engine = engine or get_whisper_engine()
+        cache_key = transcript_cache_key(
+            audio_path, engine, diarize=diarize, num_speakers=num_speakers,
+            trim_silence=trim_silence, normalize=normalize,
+        ) if cache else None
+        result = cache.get("transcripts", cache_key) if cache else None
+        from_cache = result is not None
+        if from_cache:
+            print("♻️ Транскрипт взят из кэша")
+        else:
+            with Spinner(f"🎙️ Транскрибируем аудио с помощью Whisper {engine.model_name}..."):
+                result = run_transcription(audio_path, output_dir, engine, segment_workers, diarize, num_speakers,
+                                           trim_silence=trim_silence, normalize=normalize, keep_pcm=keep_pcm,
+                                           checkpoints=checkpoints)
+            if cache:
+                cache.put("transcripts", cache_key, result)
+        transcript = result["text"]
+        segments = result.get("segments") or []
+        telemetry.annotate(
+            model=engine.model_name,
+            cached=from_cache,
+            audio_seconds=result.get("duration") or (segments[-1]["end"] if segments else None),
+            transcript_chars=len(transcript),
+            segments=len(segments),
+        )
+
+        # Сохраняем транскрипт в каталог задания, не вызывая CLI
+        base_name = Path(audio_path).stem
+        txt_path = Path(output_dir) / f"{base_name}.txt"
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            f.write(transcript)
+        save_segments(Path(output_dir) / f"{base_name}.segments.json", segments,
+                      language=result.get("language"), duration=result.get("duration"))
+        
+        print("✅ Транскрибация завершена")
+        return transcript, txt_path
+    except Exception as e:
+        print(f"❌ Неожиданная ошибка при транскрибации: {e}")
+        return None, None
+
+LINE_PREFIX = re.compile(r"^(\\[\\d+:\\d{2}:\\d{2}\\]\\s*)?(Спикер [^:]{1,20}:\\s*)?")
+# Конец предложения, но не точка после инициала («Иван Э. Петров»)
+SENTENCE_END = re.compile(r"(?<=[.!?…])(?<!\\b[А-ЯЁA-Z]\\.)\\s+")
+# Только междометия-заминки: устойчивые обороты («это самое», «так сказать») бывают частью смысла.
+# «Э.» перед словом с заглавной буквы — инициал, а не заминка
+FILLERS = re.compile(r"(?<!\\w)(?:э+м*|м{2,}|м-м)(?!\\w)(?!\\.\\s*(?-i:[А-ЯЁA-Z]))[,.]?\\s*", re.IGNORECASE)
+# Фраза из нескольких слов, повторенная подряд три и более раз («да да да», «я думаю, я думаю, я думаю»);
+# повторы из одних чисел («5 5 5 рублей») не сворачиваются, см. collapse_repeats
+REPEATED_PHRASE = re.compile(r"(?<!\\w)(\\w+(?:[\\s,]+\\w+){0,5}?)(?:[\\s,.!?…]+\\1(?!\\w)){2,}", re.IGNORECASE)
+# Типичные галлюцинации Whisper на тишине и шуме: титры и концовки роликов из обучающих данных
+HALLUCINATIONS = re.compile(
+    r"продолжение следует|субтитр\\w*\\s+(?:сделал|создавал|подготовил|делал)|dimatorzok|"
+    r"редактор субтитров|корректор [а-я]\\.|спасибо за просмотр|подписывайтесь на (?:наш )?канал",
+    re.IGNORECASE,
+)
+
+def collapse_repeats(sentence):
+    """Сворачивает зацикленные повторы фраз до одного раза; группы без букв (числа) оставляет как есть"""
+    return REPEATED_PHRASE.sub(
+        lambda m: m.group(1) if any(ch.isalpha() for ch in m.group(1)) else m.group(0), sentence)
+
+def normalize_sentence(sentence):
+    """Ключ для сравнения предложений: слова в нижнем регистре, без пунктуации"""
+    return tuple(re.sub(r"[^\\w\\s]", " ", sentence.lower()).split())
+
+def is_near_duplicate(words, seen, similarity):
+    """
+    Почти точный повтор длинного предложения: совпадают числа и почти все слова.
+    Короткие реплики («Да.», «Хорошо.») так не сравниваются: их повтор может нести смысл.
+    """
+    if len(words) < 4:
+        return False
+    if words == seen:
+        return True
+    if [w for w in words if w.isdigit()] != [w for w in seen if w.isdigit()]:
+        return False
+    import difflib
+    matcher = difflib.SequenceMatcher(None, words, seen)
+    return matcher.quick_ratio() >= similarity and matcher.ratio() >= similarity
+
+def clean_transcript(text, window=CLEANUP_WINDOW, similarity=CLEANUP_SIMILARITY):
+    """
+    Очищает транскрипт перед саммаризацией: убирает галлюцинации Whisper, слова-паразиты,
+    зацикленные повторы фраз и почти одинаковые предложения среди window последних.
+    Короткие реплики удаляются, только если повторяют предыдущее предложение подряд (зацикливание).
+    Возвращает очищенный текст и отчет о сокращении.
+    """
+    recent = collections.deque(maxlen=window)
+    previous = None
+    lines = []
+    removed = 0
+    for line in text.splitlines():
+        # Строка может начинаться с метки времени и метки спикера; повторы ищутся по спикеру
+        match = LINE_PREFIX.match(line)
+        prefix = match.group(0)
+        speaker = match.group(2) or ""
+        kept = []
+        for original in SENTENCE_END.split(line[len(prefix):]):
+            sentence = collapse_repeats(FILLERS.sub("", original))
+            sentence = re.sub(r"\\s+([,.!?…])", r"\\1", " ".join(sentence.split())).strip(" ,")
+            words = normalize_sentence(sentence)
+            if not words or HALLUCINATIONS.search(sentence):
+                removed += bool(words)
+                continue
+            # Повторы ищутся только среди последних предложений того же спикера
+            if previous == (speaker, words) or \\
+                    any(owner == speaker and is_near_duplicate(words, seen, similarity) for owner, seen in recent):
+                removed += 1
+                continue
+            previous = (speaker, words)
+            recent.append((speaker, words))
+            if original[:1].isupper():
+                sentence = sentence[0].upper() + sentence[1:]
+            kept.append(sentence)
+        if kept:
+            lines.append(prefix + " ".join(kept))
+
+    cleaned = "\\n".join(lines)
+    report = {
+        "tokens_before": estimate_tokens(text),
+        "tokens_after": estimate_tokens(cleaned),
+        "removed_sentences": removed,
+    }
+    return cleaned, report
+
+def split_into_chunks(text, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """Делит текст на фрагменты примерно по chunk_tokens токенов с перекрытием, стараясь резать по границам предложений"""
+    text = text.strip()
+    chunk_size = int(chunk_tokens * CHARS_PER_TOKEN)
+    overlap = int(overlap * CHARS_PER_TOKEN)
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Ищем ближайшую границу предложения/строки во второй половине фрагмента
+            boundary = max(text.rfind(sep, start + chunk_size // 2, end) for sep in ("\\n", ". ", "! ", "? "))
+            if boundary != -1:
+                end = boundary + 1
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def format_generation_stats(stats):
+    """Форматирует статистику генерации для вывода"""
+    ttft = stats.get("time_to_first_token")
+    tps = stats.get("tokens_per_second")
+    return (f"первый токен через {ttft:.1f} с" if ttft is not None else "нет токенов") + \\
+        (f", {tps:.1f} ток/с" if tps else "") + f", {stats.get('eval_count', 0)} токенов"
+
+def map_stage_num_ctx():
+    """
+    Контекст многофрагментного задания: фрагмент полного размера с резервом под конспект
+    и reduce-запрос из CHUNK_TOKENS частичных конспектов с резервом под итог.
+    Reduce сворачивает конспекты до CHUNK_TOKENS, поэтому больших запросов в задании не бывает.
+    """
+    full = "x" * int(CHUNK_TOKENS * token_budget.chars_per_token)
+    return max(
+        token_budget.num_ctx(CHUNK_PROMPT.format(index=1, total=1, text=full), CHUNK_OUTPUT_TOKENS),
+        token_budget.num_ctx(REDUCE_PROMPT.format(sections=SUMMARY_SECTIONS, text=full), SUMMARY_OUTPUT_TOKENS),
+    )
+
+def reduce_summaries(partials, on_token=None, stats=None, checkpoints=None, num_ctx=None):
+    """Reduce-шаг: объединяет частичные конспекты в итоговое краткое содержание"""
+    # Если частичных конспектов слишком много для одного контекста, сворачиваем их по уровням
+    while len(partials) > 1 and sum(estimate_tokens(p) for p in partials) > CHUNK_TOKENS:
+        groups = split_into_chunks("\\n\\n".join(partials), overlap=0)
+        if len(groups) >= len(partials):
+            break
+        partials = ollama_generate_many([MERGE_PROMPT.format(text=group) for group in groups],
+                                        checkpoints=checkpoints, num_ctx=num_ctx)
+
+    combined = "\\n\\n".join(f"Часть {i}:\\n{p}" for i, p in enumerate(partials, 1))
+    return ollama_generate(REDUCE_PROMPT.format(sections=SUMMARY_SECTIONS, text=combined),
+                           on_token=on_token, stats=stats, num_ctx=num_ctx)
+
+@log_step_time
+def summarize_text(text, cache=None, output_path=None, checkpoints=None, cleanup=True):
+    """
+    Создает краткое содержание всего текста с помощью Ollama (map-reduce).
+    Если указан output_path, итоговый Markdown дописывается в файл по мере генерации.
+    С checkpoints ответы по фрагментам сохраняются, и после сбоя повторяются только недостающие.
+    При cleanup транскрипт сначала очищается от повторов и слов-паразитов (см. clean_transcript).
+    """
+    try:
+        if cleanup:
+            with telemetry.span("summarize.cleanup") as span:
+                text, report = clean_transcript(text)
+                span.update(report)
+            before, after = report["tokens_before"], report["tokens_after"]
+            saved = (before - after) / before if before else 0
+            print(f"🧹 Очистка транскрипта: {before} → {after} токенов (−{saved:.0%}), "
+                  f"убрано повторов и галлюцинаций: {report['removed_sentences']}")
+        cache_key = summary_cache_key(text) if cache else None
+        cached = cache.get("summaries", cache_key) if cache else None
+        telemetry.annotate(transcript_chars=len(text), cached=bool(cached))
+        if cached:
+            print("♻️ Краткое содержание взято из кэша")
+            return cached["summary"]
+
+        chunks = split_into_chunks(text)
+        telemetry.annotate(chunks=len(chunks), transcript_tokens_estimate=estimate_tokens(text))
+        if not chunks:
+            print("❌ Пустой транскрипт, нечего саммаризировать")
+            return None
+
+        stats = {}
+        output_file = open(output_path, 'w', encoding='utf-8') if output_path else None
+        def write_token(token):
+            output_file.write(token)
+            output_file.flush()
+        on_token = write_token if output_file else None
+
+        # Один контекст на все задание по самому большому запросу: смена num_ctx между стадиями
+        # заставила бы Ollama перезагружать модель. Размер выбирается заново для каждого задания,
+        # чтобы память под KV-кэш следовала длине записи
+        if len(chunks) == 1:
+            prompt = SUMMARY_PROMPT.format(sections=SUMMARY_SECTIONS, text=chunks[0])
+            num_ctx = token_budget.num_ctx(prompt, SUMMARY_OUTPUT_TOKENS)
+        else:
+            total = len(chunks)
+            prompts = [CHUNK_PROMPT.format(index=index, total=total, text=chunk) for index, chunk in enumerate(chunks, 1)]
+            num_ctx = max(map_stage_num_ctx(), *(token_budget.num_ctx(p, CHUNK_OUTPUT_TOKENS) for p in prompts))
+        telemetry.annotate(num_ctx=num_ctx)
+
+        try:
+            if len(chunks) == 1:
+                with Spinner(f"🧠 Создаем краткое содержание с помощью {LLM_MODEL}..."):
+                    summary = ollama_generate(prompt, on_token=on_token, stats=stats, num_ctx=num_ctx)
+            else:
+                with Spinner(f"🧠 Обрабатываем {total} фрагментов (до {MAX_PARALLEL_REQUESTS} параллельно)..."), \\
+                        telemetry.span("summarize.map", chunks=total):
+                    # Map-шаг: каждый фрагмент кратко излагается отдельно, запросы идут параллельно
+                    partials = ollama_generate_many(prompts, checkpoints=checkpoints, num_ctx=num_ctx)
+                with Spinner("🧩 Объединяем частичные конспекты..."), telemetry.span("summarize.reduce"):
+                    summary = reduce_summaries(partials, on_token=on_token, stats=stats, checkpoints=checkpoints,
+                                               num_ctx=num_ctx)
+        finally:
+            if output_file:
+                output_file.close()
+        telemetry.annotate(final_prompt_eval_count=stats.get("prompt_eval_count"),
+                           final_eval_count=stats.get("eval_count"),
+                           final_time_to_first_token=stats.get("time_to_first_token"))
+        print(f"⚡ Итоговая генерация: {format_generation_stats(stats)}")
+
+        if cache and summary:
+            cache.put("summaries", cache_key, {"summary": summary})
+        print("✅ Саммаризация завершена")
+        return summary
+
+    except Exception as e:
+        print(f"❌ Неожиданная ошибка при саммаризации: {e}")
+        return None
+
+@log_step_time
+def save_markdown(summary, output_path):
+    """Сохраняет результат в Markdown файл"""
+    try:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(summary)
+        print(f"✅ Результат сохранен в файл: {output_path}")
+        return True
+    except Exception as e:
+        print(f"❌ Ошибка при сохранении файла: {e}")
+        return False
+
+AUDIO_EXTENSIONS = {".m4a", ".mp3", ".wav", ".ogg", ".opus", ".flac", ".aac", ".webm", ".mp4", ".mkv"}
+
+def collect_audio_files(inputs):
+    """Раскрывает файлы, каталоги и glob-шаблоны в упорядоченный список аудиофайлов без повторов"""
+    files = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = sorted(p for p in path.iterdir() if p.suffix.lower() in AUDIO_EXTENSIONS)
+        elif path.exists():
+            candidates = [path]
+        else:
+            candidates = sorted(Path(p) for p in glob.glob(item, recursive=True))
+            candidates = [p for p in candidates if p.is_file() and p.suffix.lower() in AUDIO_EXTENSIONS]
+            if not candidates:
+                print(f"❌ Аудиофайл {item} не найден")
+        for candidate in candidates:
+            resolved = candidate.resolve()
+            if resolved not in files:
+                files.append(resolved)
+    return files
+
+def write_job_manifest(job, models=None):
+    """Сохраняет в каталоге задания job.json: итог задания и модели, которыми оно обработано"""
+    manifest = {
+        "audio": str(job["audio_path"]),
+        "status": "failed" if job["error"] else "done",
+        "error": job["error"],
+        "transcript": str(job["transcript_path"]) if job["transcript_path"] else None,
+        "summary": str(job["summary_path"]) if job["summary_path"] else None,
+        **(models or {}),
+    }
+    try:
+        with open(job["job_dir"] / "job.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить job.json: {e}")
+
+def make_job_dir(output_root, audio_path):
+    """Создает отдельный каталог задания: имя файла плюс хэш полного пути, чтобы одинаковые имена не пересекались"""
+    digest = hashlib.sha1(str(Path(audio_path).resolve()).encode("utf-8")).hexdigest()[:8]
+    job_dir = Path(output_root) / f"{Path(audio_path).stem}_{digest}"
+    job_dir.mkdir(parents=True, exist_ok=True)
+    return job_dir
+
+class Pipeline:
+    """
+    Конвейерная обработка: пока Ollama саммаризирует файл N, Whisper транскрибирует файл N+1.
+    У каждой стадии своя очередь и свой пул потоков; задания можно добавлять, пока конвейер работает.
+    """
+    def __init__(self, output_root, transcribe_workers=1, summarize_workers=1, segment_workers=0,
+                 cache=None, llm_ready=None, diarize=False, num_speakers=None, preprocess=None, resume=True,
+                 scheduler=None, models=None, cleanup=True, formats=()):
+        self.output_root = Path(output_root)
+        self.transcribe_workers = max(1, transcribe_workers)
+        self.summarize_workers = max(1, summarize_workers)
+        self.segment_workers = segment_workers
+        self.cache = cache
+        self.llm_ready = llm_ready
+        self.diarize = diarize
+        self.num_speakers = num_speakers
+        self.preprocess = preprocess or {}
+        self.resume = resume
+        self.scheduler = scheduler
+        self.models = models
+        self.cleanup = cleanup
+        self.formats = formats
+        self.jobs = []
+        self._transcribe_queue = queue.Queue()
+        self._summarize_queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._transcribers = []
+        self._summarizers = []
+
+    def start(self):
+        self._transcribers = [threading.Thread(target=self._transcribe_worker, daemon=True)
+                              for _ in range(self.transcribe_workers)]
+        self._summarizers = [threading.Thread(target=self._summarize_worker, daemon=True)
+                             for _ in range(self.summarize_workers)]
+        for thread in self._transcribers + self._summarizers:
+            thread.start()
+        return self
+
+    def submit(self, audio_path, job_id=None, diarize=None, num_speakers=None, on_finish=None):
+        """
+        Ставит файл в очередь транскрибации и возвращает словарь задания.
+        on_finish(job) вызывается после завершения задания, успешного или нет.
+        """
+        job = {"id": job_id or hashlib.sha1(str(Path(audio_path).resolve()).encode("utf-8")).hexdigest()[:12],
+               "audio_path": Path(audio_path), "job_dir": make_job_dir(self.output_root, audio_path),
+               "transcript_path": None, "summary_path": None, "error": None, "status": "queued",
+               "diarize": self.diarize if diarize is None else diarize,
+               "num_speakers": self.num_speakers if num_speakers is None else num_speakers,
+               "submitted_at": time.time(), "finished_at": None, "on_finish": on_finish}
+        # Контрольные точки живут в каталоге задания, который одинаков для одного и того же входного файла
+        job["checkpoints"] = open_checkpoints(job["job_dir"])
+        if not self.resume:
+            job["checkpoints"].clear()
+        with self._lock:
+            self.jobs.append(job)
+        self._expect("whisper")
+        self._transcribe_queue.put(job)
+        return job
+
+    def _expect(self, model):
+        if self.scheduler:
+            self.scheduler.expect(model)
+
+    def _use(self, model):
+        return self.scheduler.use(model) if self.scheduler else contextlib.nullcontext()
+
+    def close(self):
+        """Дожидается обработки всех поставленных заданий и останавливает потоки"""
+        for _ in self._transcribers:
+            self._transcribe_queue.put(None)
+        for thread in self._transcribers:
+            thread.join()
+        # Все транскрипты поставлены в очередь, останавливаем саммаризаторов
+        for _ in self._summarizers:
+            self._summarize_queue.put(None)
+        for thread in self._summarizers:
+            thread.join()
+        return self.jobs
+
+    def pending(self):
+        """Число заданий, которые еще не завершены"""
+        with self._lock:
+            return sum(1 for job in self.jobs if job["status"] not in ("done", "failed"))
+
+    def forget(self, job):
+        """Убирает завершенное задание из списка (долгоживущий сервис не копит их без предела)"""
+        with self._lock:
+            self.jobs.remove(job)
+
+    def _finish(self, job, error=None):
+        job["error"] = error
+        job["status"] = "failed" if error else "done"
+        job["finished_at"] = time.time()
+        write_job_manifest(job, self.models)
+        telemetry.count("jobs_total", status="error" if error else "ok")
+        if job["on_finish"]:
+            job["on_finish"](job)
+
+    def _transcribe_worker(self):
+        # Каждому потоку своя резидентная модель; при одном потоке используется общий движок.
+        # В сегментном режиме модели живут в пуле процессов, а движок нужен только для параметров.
+        if self.transcribe_workers == 1 or self.segment_workers > 1:
+            engine = get_whisper_engine()
+        else:
+            engine = WhisperEngine()
+        while True:
+            job = self._transcribe_queue.get()
+            if job is None:
+                break
+            job["status"] = "transcribing"
+            print(f"🎙️ [{job['audio_path'].name}] Транскрибация...")
+            with telemetry.bind(job=job["audio_path"].name), self._use("whisper"):
+                transcript, transcript_path = transcribe_audio(
+                    job["audio_path"], job["job_dir"], engine=engine, segment_workers=self.segment_workers,
+                    cache=self.cache, diarize=job["diarize"], num_speakers=job["num_speakers"],
+                    checkpoints=job["checkpoints"], **self.preprocess,
+                )
+            if transcript:
+                job["transcript_path"] = transcript_path
+                job["status"] = "transcribed"
+                # Субтитры и текст с метками времени строятся из сохраненных сегментов, без повторной транскрибации
+                data = load_segments(segments_path_for(transcript_path))
+                if data and data["segments"]:
+                    export_transcript(data["segments"], transcript_path.with_suffix(""), self.formats)
+                    job["duration"] = data.get("duration")
+                    transcript = format_timed_transcript(data["segments"])
+                self._expect("llm")
+                self._summarize_queue.put((job, transcript))
+            else:
+                self._finish(job, "Не удалось транскрибировать аудио")
+
+    def _summarize_worker(self):
+        while True:
+            item = self._summarize_queue.get()
+            if item is None:
+                break
+            job, transcript = item
+            with self._use("llm"):
+                # LLM готовится в фоне, пока идет транскрибация: ждем ее только перед первой саммаризацией
+                if self.llm_ready is not None and not self.llm_ready():
+                    self._finish(job, "LLM недоступна")
+                    continue
+                with telemetry.bind(job=job["audio_path"].name):
+                    self._finish(job, self._summarize_job(job, transcript))
+
+    def _summarize_job(self, job, transcript):
+        job["status"] = "summarizing"
+        print(f"🧠 [{job['audio_path'].name}] Саммаризация...")
+        # Итоговый Markdown появляется в файле по мере генерации
+        output_path = job["job_dir"] / f"{job['audio_path'].stem}_summary.md"
+        summary = summarize_text(transcript, cache=self.cache, output_path=output_path,
+                                 checkpoints=job["checkpoints"], cleanup=self.cleanup)
+        if not summary:
+            return "Не удалось создать краткое содержание"
+        summary = link_timestamps(summary, job["audio_path"], job["job_dir"], job.get("duration"))
+        if not save_markdown(summary, output_path):
+            return "Ошибка при сохранении файла"
+        job["summary_path"] = output_path
+        # Задание завершено: промежуточные результаты больше не нужны
+        job["checkpoints"].clear()
+        return None
+
+def run_pipeline(audio_files, output_root, transcribe_workers=1, summarize_workers=1, segment_workers=0,
+                 cache=None, llm_ready=None, diarize=False, num_speakers=None, preprocess=None, resume=True,
+                 scheduler=None, models=None, cleanup=True, formats=()):
+    """Обрабатывает список файлов конвейером и возвращает задания по завершении"""
+    pipeline = Pipeline(output_root, transcribe_workers, summarize_workers, segment_workers, cache=cache,
+                        llm_ready=llm_ready, diarize=diarize, num_speakers=num_speakers, preprocess=preprocess,
+                        resume=resume, scheduler=scheduler, models=models, cleanup=cleanup,
+                        formats=formats).start()
+    for audio_path in audio_files:
+        pipeline.submit(audio_path)
+    return pipeline.close()
+
+def open_live_stream(source):
+    """
+    Запускает ffmpeg, который читает живой источник и отдает PCM float32 16 кГц моно в stdout.
+    source: "-" (stdin), именованный канал или растущий файл (читается, пока дописывается).
+    """
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    stdin = subprocess.DEVNULL
+    if source == "-":
+        command += ["-i", "pipe:0"]
+        stdin = sys.stdin.buffer
+    elif Path(source).is_fifo():
+        command += ["-nostdin", "-i", str(source)]
+    else:
+        # Растущий файл: ffmpeg ждет новых данных и завершается, если файл не растет LIVE_IDLE_TIMEOUT секунд
+        command += ["-nostdin", "-follow", "1", "-rw_timeout", str(int(LIVE_IDLE_TIMEOUT * 1e6)), "-i", f"file:{source}"]
+    command += ["-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "f32le", "-acodec", "pcm_f32le", "pipe:1"]
+    return subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE)
+
+class RollingSummarizer:
+    """
+    Скользящее краткое содержание живой встречи: новые фрагменты транскрипта накапливаются
+    и периодически вливаются в уже готовое саммари, а не пересчитываются с нуля.
+    """
+    def __init__(self, output_path, llm_ready=None, min_chars=LIVE_SUMMARY_MIN_CHARS, cleanup=True):
+        self.output_path = Path(output_path)
+        self.llm_ready = llm_ready
+        self.cleanup = cleanup
+        self.min_chars = min_chars
+        self.summary = ""
+        self.error = None
+        self.updates = 0
+        self._pending = []
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def add(self, text):
+        """Добавляет новый фрагмент транскрипта"""
+        with self._condition:
+            self._pending.append(text)
+            self._condition.notify()
+
+    def close(self):
+        """Сообщает о конце потока и ждет финального обновления"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        return self.summary
+
+    def _take_pending(self):
+        with self._condition:
+            while not self._closed and sum(len(text) for text in self._pending) < self.min_chars:
+                self._condition.wait()
+            pending = "\\n".join(self._pending)
+            self._pending = []
+            return pending, self._closed
+
+    def _run(self):
+        if self.llm_ready is not None and not self.llm_ready():
+            self.error = "LLM недоступна"
+            return
+        while True:
+            pending, closed = self._take_pending()
+            if pending.strip():
+                try:
+                    self._update(pending)
+                except Exception as e:
+                    # Фрагмент не теряется: он войдет в следующее обновление
+                    print(f"⚠️ Не удалось обновить краткое содержание: {e}")
+                    self.error = str(e)
+                    with self._condition:
+                        self._pending.insert(0, pending)
+                    if closed:
+                        return
+                    time.sleep(5)
+                    continue
+            if closed:
+                return
+
+    def _update(self, text):
+        if self.cleanup:
+            text, _ = clean_transcript(text)
+        # Длинное накопление (например, пока LLM была недоступна) вливается по частям
+        for chunk in split_into_chunks(text, overlap=0):
+            with telemetry.span("live.summary_update", new_chars=len(chunk)):
+                if self.summary:
+                    prompt = LIVE_UPDATE_PROMPT.format(sections=SUMMARY_SECTIONS, summary=self.summary, text=chunk)
+                else:
+                    prompt = SUMMARY_PROMPT.format(sections=SUMMARY_SECTIONS, text=chunk)
+                self.summary = ollama_generate(prompt)
+            self.updates += 1
+            self.error = None
+            tmp_path = self.output_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.summary)
+            os.replace(tmp_path, self.output_path)
+            print(f"📝 Краткое содержание обновлено ({self.updates}): {self.output_path}")
+
+def read_pcm_stream(stream, chunks, block_seconds=0.5):
+    """Читает PCM из stdout ffmpeg в очередь массивов; None в очереди — конец потока"""
+    import numpy as np
+    block_bytes = int(SAMPLE_RATE * block_seconds) * 4
+    leftover = b""
+    try:
+        while True:
+            data = stream.read(block_bytes)
+            if not data:
+                break
+            data = leftover + data
+            usable = len(data) - len(data) % 4
+            leftover = data[usable:]
+            chunks.put(np.frombuffer(data[:usable], dtype=np.float32))
+    finally:
+        chunks.put(None)
+
+def run_live(source, output_root, name=None, engine=None, llm_ready=None, window_sec=LIVE_WINDOW_SEC,
+             cleanup=True, formats=()):
+    """
+    Живой режим: транскрибирует поток окнами по мере поступления звука и ведет скользящее саммари.
+    Окно режется по ближайшей паузе, чтобы не рвать слова; таймкоды отсчитываются от начала потока.
+    """
+    import numpy as np
+
+    name = name or f"live_{time.strftime('%Y%m%d_%H%M%S')}"
+    job = {"audio_path": Path(name), "job_dir": Path(output_root) / name,
+           "transcript_path": None, "summary_path": None, "error": None}
+    job["job_dir"].mkdir(parents=True, exist_ok=True)
+    transcript_path = job["job_dir"] / f"{name}.txt"
+    summary_path = job["job_dir"] / f"{name}_summary.md"
+    engine = engine or get_whisper_engine()
+    engine.load()
+
+    process = open_live_stream(source)
+    chunks = queue.Queue()
+    reader = threading.Thread(target=read_pcm_stream, args=(process.stdout, chunks), daemon=True)
+    reader.start()
+    summarizer = RollingSummarizer(summary_path, llm_ready=llm_ready, cleanup=cleanup).start()
+
+    window = int(window_sec * SAMPLE_RATE)
+    buffer = np.empty(0, dtype=np.float32)
+    offset_sec = 0.0
+    previous_text = ""
+    segments = []
+    print(f"🔴 Живой режим: слушаем {'stdin' if source == '-' else source} (окно {window_sec:g} с)")
+
+    def transcribe_window(audio):
+        nonlocal previous_text
+        with telemetry.span("live.window", start=offset_sec, seconds=len(audio) / SAMPLE_RATE):
+            # Хвост предыдущего окна подсказывает Whisper контекст и написание имен
+            result = engine.transcribe(audio, initial_prompt=previous_text[-200:] or None)
+        new_segments = [{**seg, "start": seg["start"] + offset_sec, "end": seg["end"] + offset_sec}
+                        for seg in result["segments"] if seg["text"]]
+        if not new_segments:
+            return
+        segments.extend(new_segments)
+        text = "\\n".join(seg["text"] for seg in new_segments)
+        previous_text = text
+        with open(transcript_path, "a", encoding="utf-8") as f:
+            f.write(text + "\\n")
+        summarizer.add(text)
+
+    with telemetry.span("live", source=str(source)):
+        finished = False
+        while not finished:
+            chunk = chunks.get()
+            if chunk is None:
+                finished = True
+            else:
+                buffer = np.concatenate([buffer, chunk])
+            while len(buffer) >= window or (finished and len(buffer) > SAMPLE_RATE // 2):
+                cut = len(buffer)
+                if len(buffer) >= window:
+                    # Режем по последней паузе во второй половине окна, иначе ровно по границе окна
+                    cuts = [c for c in find_speech_cuts(buffer[:window]) if c >= window // 2]
+                    cut = cuts[-1] if cuts else window
+                transcribe_window(buffer[:cut])
+                offset_sec += cut / SAMPLE_RATE
+                buffer = buffer[cut:]
+            if finished:
+                break
+
+        process.wait()
+        print("⏹️ Поток закрыт, завершаем краткое содержание...")
+        final_start = time.monotonic()
+        summary = summarizer.close()
+        print(f"✅ Финальное краткое содержание готово через {format_duration(time.monotonic() - final_start)}")
+
+    job["transcript_path"] = transcript_path if segments else None
+    if segments:
+        save_segments(job["job_dir"] / f"{name}.segments.json", segments,
+                      language=WHISPER_LANGUAGE, duration=offset_sec)
+        export_transcript(segments, job["job_dir"] / name, formats)
+    if not segments:
+        job["error"] = "В потоке не распознано речи"
+    elif summary and not summarizer.error:
+        job["summary_path"] = summary_path
+    else:
+        job["error"] = summarizer.error or "Не удалось создать краткое содержание"
+    return job
+
+# Архив встреч: векторный индекс
+def iter_archive_documents(roots):
+    """
+    Находит в каталогах результаты обработки: транскрипты с таймкодами (<имя>.segments.json),
+    транскрипты без них (<имя>.txt рядом с <имя>_summary.md) и краткие содержания.
+    Возвращает (путь, встреча, вид документа).
+    """
+    for root in roots:
+        root = Path(root)
+        for path in sorted(root.rglob("*.segments.json")):
+            yield path, path.name[:-len(".segments.json")], "transcript"
+        for path in sorted(root.rglob("*_summary.md")):
+            meeting = path.name[:-len("_summary.md")]
+            transcript = path.with_name(f"{meeting}.txt")
+            if transcript.exists() and not path.with_name(f"{meeting}.segments.json").exists():
+                yield transcript, meeting, "transcript"
+            yield path, meeting, "summary"
+
+def document_passages(path, kind, max_chars=INDEX_PASSAGE_CHARS):
+    """
+    Делит документ на фрагменты для индексации: подряд идущие сегменты транскрипта
+    объединяются примерно до max_chars символов. Возвращает (начало, конец, текст).
+    """
+    if path.suffix == ".json":
+        with open(path, encoding="utf-8") as f:
+            units = [(seg["start"], seg["end"], seg["text"]) for seg in json.load(f)["segments"]]
+    else:
+        text = path.read_text(encoding="utf-8")
+        if kind == "summary":
+            # Раздел краткого содержания — отдельный фрагмент вместе с заголовком
+            text = re.sub(r"\\n(?=#)", "\\n\\n", text)
+            units = [(None, None, block) for block in re.split(r"\\n\\s*\\n", text)]
+        else:
+            units = [(None, None, line) for line in text.splitlines()]
+
+    passages = []
+    for start, end, text in units:
+        text = text.strip()
+        if not text:
+            continue
+        if passages and len(passages[-1][2]) + len(text) < max_chars and not text.startswith("#"):
+            first_start, _, previous = passages[-1]
+            passages[-1] = (first_start, end, f"{previous}\\n{text}")
+        else:
+            passages.append((start, end, text))
+    return passages
+
+class ArchiveIndex:
+    """
+    Векторный индекс архива встреч: нормированные эмбеддинги лежат построчно в файле float32
+    (читается через memmap), метаданные фрагментов — в SQLite. Строки только добавляются;
+    при переиндексации измененного файла старые строки помечаются удаленными.
+    """
+    def __init__(self, root=INDEX_DIR, model=EMBED_MODEL):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.root / "vectors.f32"
+        import sqlite3
+        self.db = sqlite3.connect(self.root / "index.sqlite")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE, sha256 TEXT, meeting TEXT, kind TEXT, indexed_at REAL);
+            CREATE TABLE IF NOT EXISTS passages (
+                row INTEGER PRIMARY KEY, document_id INTEGER, start_sec REAL, end_sec REAL, text TEXT,
+                deleted INTEGER DEFAULT 0);
+        """)
+        meta = dict(self.db.execute("SELECT key, value FROM meta"))
+        if meta.get("model", model) != model:
+            raise ValueError(f"Индекс построен моделью {meta['model']}, а запрошена {model}; "
+                             f"укажите другой каталог индекса")
+        self.model = model
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.rows = self.db.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        # Векторы, записанные до сбоя без метаданных, отбрасываем
+        if self.dim and self.vectors_path.exists() and self.vectors_path.stat().st_size > self.rows * self.dim * 4:
+            os.truncate(self.vectors_path, self.rows * self.dim * 4)
+
+    def close(self):
+        self.db.close()
+
+    def embed(self, texts):
+        """Эмбеддинги текстов через Ollama, нормированные для косинусной близости"""
+        import numpy as np
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH):
+            vectors += get_ollama_client().embed(texts[start:start + EMBED_BATCH], model=self.model)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return matrix
+
+    def add_document(self, path, meeting, kind):
+        """Индексирует документ, если он новый или изменился. Возвращает число добавленных фрагментов"""
+        path = Path(path).resolve()
+        digest = hash_file(path)
+        existing = self.db.execute("SELECT id, sha256 FROM documents WHERE path = ?", (str(path),)).fetchone()
+        if existing and existing[1] == digest:
+            return 0
+
+        passages = document_passages(path, kind)
+        matrix = self.embed([text for _, _, text in passages]) if passages else None
+        if matrix is not None and self.dim is None:
+            self.dim = matrix.shape[1]
+            self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                [("model", self.model), ("dim", str(self.dim))])
+        if matrix is not None:
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+
+        with self.db:
+            if existing:
+                self.db.execute("UPDATE passages SET deleted = 1 WHERE document_id = ?", (existing[0],))
+                self.db.execute("UPDATE documents SET sha256 = ?, indexed_at = ? WHERE id = ?",
+                                (digest, time.time(), existing[0]))
+                document_id = existing[0]
+            else:
+                document_id = self.db.execute(
+                    "INSERT INTO documents (path, sha256, meeting, kind, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                    (str(path), digest, meeting, kind, time.time()),
+                ).lastrowid
+            self.db.executemany(
+                "INSERT INTO passages (row, document_id, start_sec, end_sec, text) VALUES (?, ?, ?, ?, ?)",
+                [(self.rows + i, document_id, start, end, text) for i, (start, end, text) in enumerate(passages)],
+            )
+        self.rows += len(passages)
+        return len(passages)
+
+    def search(self, query, top_k=5):
+        """Top-k фрагментов по косинусной близости к запросу"""
+        import numpy as np
+        if not self.rows or not self.dim:
+            return []
+        matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        scores = np.asarray(matrix @ self.embed([query])[0])
+        deleted = [row for (row,) in self.db.execute("SELECT row FROM passages WHERE deleted = 1")]
+        scores[deleted] = -np.inf
+        top_k = min(top_k, self.rows - len(deleted))
+        if top_k <= 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        results = []
+        for row in best:
+            meeting, kind, path, start, end, text = self.db.execute(
+                "SELECT d.meeting, d.kind, d.path, p.start_sec, p.end_sec, p.text "
+                "FROM passages p JOIN documents d ON d.id = p.document_id WHERE p.row = ?", (int(row),),
+            ).fetchone()
+            results.append({"score": float(scores[row]), "meeting": meeting, "kind": kind, "path": path,
+                            "start": start, "end": end, "text": text})
+        return results
+
+def parse_archive_args(command, argv):
+    """Разбирает аргументы подкоманд index и search"""
+    parser = argparse.ArgumentParser(prog=f"summarize.py {command}")
+    if command == "index":
+        parser.description = "Добавляет в индекс новые и измененные транскрипты и краткие содержания"
+        parser.add_argument("roots", nargs="+", help="каталоги с результатами обработки")
+    else:
+        parser.description = "Ищет по индексу фрагменты встреч, близкие к запросу по смыслу"
+        parser.add_argument("query", help="текст запроса")
+        parser.add_argument("-k", "--top-k", type=int, default=5, help="сколько фрагментов вывести")
+    parser.add_argument("--index-dir", default=str(INDEX_DIR),
+                        help="каталог индекса (по умолчанию $SUMMARIZER_INDEX_DIR или ~/.local/share/summarizer/index)")
+    parser.add_argument("--embed-model", default=EMBED_MODEL, help="модель эмбеддингов Ollama")
+    return parser.parse_args(argv)
+
+def archive_main(command, argv):
+    """Подкоманды index и search: индексация архива встреч и поиск по нему"""
+    import requests
+    args = parse_archive_args(command, argv)
     ollama_process = None
-    if not check_ollama_server():
+    if not ollama_is_up():
         ollama_process = start_ollama_server()
         if not ollama_process:
             print("❌ Не удалось запустить Ollama. Убедитесь, что Ollama установлен.")
             sys.exit(1)
-    
-    # Убеждаемся, что модель Gemma доступна
-    if not ensure_gemma_model():
-        print("❌ Не удалось загрузить модель Gemma 3 27B")
-        if ollama_process:
-            ollama_process.terminate()
-        sys.exit(1)
-    
-    # Транскрибируем аудио
-    transcript, transcript_path = transcribe_audio(audio_path)
-    if not transcript:
-        print("❌ Не удалось транскрибировать аудио")
-        if ollama_process:
-            ollama_process.terminate()
-        sys.exit(1)
-    
-    # Создаем краткое содержание
-    summary = summarize_text(transcript)
-    if not summary:
-        print("❌ Не удалось создать краткое содержание")
-        if ollama_process:
-            ollama_process.terminate()
+    try:
+        if command == "index" and not ensure_llm_model(args.embed_model):
+            sys.exit(1)
+        index = ArchiveIndex(args.index_dir, args.embed_model)
+        try:
+            if command == "index":
+                documents = list(iter_archive_documents(args.roots))
+                added = 0
+                with Spinner(f"📚 Индексируем {len(documents)} документов..."):
+                    for path, meeting, kind in documents:
+                        added += index.add_document(path, meeting, kind)
+                print(f"✅ Добавлено фрагментов: {added}, всего в индексе: {index.rows}")
+            else:
+                results = index.search(args.query, args.top_k)
+                if not results:
+                    print("🔍 Ничего не найдено")
+                for result in results:
+                    when = f" {format_clock(result['start'])}" if result["start"] is not None else ""
+                    kind = "саммари" if result["kind"] == "summary" else "транскрипт"
+                    print(f"\\n📄 {result['meeting']}{when} ({kind}, близость {result['score']:.3f})")
+                    print(f"   {result['path']}")
+                    print("   " + result["text"].replace("\\n", "\\n   "))
+        finally:
+            index.close()
+    except (ValueError, requests.exceptions.RequestException, RuntimeError) as e:
+        print(f"❌ {e}")
         sys.exit(1)
-    
-    # Сохраняем результат
-    base_name = Path(audio_path).stem
-    output_path = f"{base_name}_summary.md"
-    if save_markdown(summary, output_path):
-        print("🎉 Процесс завершен успешно!")
+    finally:
+        stop_ollama_server(ollama_process)
+
+# Режим сервиса
+def job_status(job):
+    """Описание задания для HTTP API"""
+    return {
+        "id": job["id"],
+        "name": job["audio_path"].name,
+        "status": job["status"],
+        "error": job["error"],
+        "submitted_at": job["submitted_at"],
+        "finished_at": job["finished_at"],
+        "transcript": bool(job["transcript_path"]),
+        "summary": bool(job["summary_path"]),
+    }
+
+def serve_jobs(pipeline, port, host="127.0.0.1", max_queued=SERVICE_MAX_QUEUED):
+    """
+    HTTP API очереди заданий поверх конвейера:
+      POST /jobs?name=meeting.m4a  — тело запроса с аудиофайлом, ответ 202 с id задания
+      GET  /jobs, /jobs/<id>       — статус заданий
+      GET  /jobs/<id>/transcript[?format=srt|vtt|json], /jobs/<id>/summary — результаты
+      GET  /metrics                — метрики Prometheus
+    Задания обрабатываются конвейером с одной резидентной моделью Whisper; сверх max_queued
+    незавершенных заданий загрузка отклоняется с 503, чтобы очередь не росла без предела.
+    Загруженный файл удаляется, как только задание завершено, а из завершенных заданий
+    помнятся SERVICE_MAX_FINISHED последних: результаты остаются в каталогах заданий.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    upload_dir = Path(pipeline.output_root) / "uploads"
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    jobs = {}
+    jobs_lock = threading.Lock()
+
+    def finish_job(job):
+        # Результаты уже в каталоге задания, загрузка больше не нужна
+        shutil.rmtree(job["audio_path"].parent, ignore_errors=True)
+        with jobs_lock:
+            finished = sorted((old for old in jobs.values() if old["finished_at"]), key=lambda old: old["finished_at"])
+            for old in finished[:max(0, len(finished) - SERVICE_MAX_FINISHED)]:
+                del jobs[old["id"]]
+                pipeline.forget(old)
+
+    class JobsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body, content_type):
+            body = body.encode("utf-8") if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status, payload):
+            self.send_body(status, json.dumps(payload, ensure_ascii=False), "application/json; charset=utf-8")
+
+        def find_job(self, job_id):
+            with jobs_lock:
+                job = jobs.get(job_id)
+            if job is None:
+                self.send_json(404, {"error": "задание не найдено"})
+            return job
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/jobs":
+                self.send_json(404, {"error": "неизвестный адрес"})
+                return
+            # Все параметры и заголовки проверяются до чтения тела: ошибка не оставляет файлов на диске
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = 0
+            if length <= 0:
+                self.send_json(411, {"error": "нужен заголовок Content-Length и непустое тело"})
+                return
+            if pipeline.pending() >= max_queued:
+                self.send_json(503, {"error": "очередь заполнена, повторите позже"})
+                return
+            params = parse_qs(url.query)
+            name = Path(params.get("name", ["audio.m4a"])[0]).name
+            if Path(name).suffix.lower() not in AUDIO_EXTENSIONS:
+                self.send_json(415, {"error": f"неподдерживаемый формат: {name}"})
+                return
+            diarize = None
+            if "diarize" in params:
+                value = params["diarize"][0].lower()
+                if value not in ("1", "true", "yes", "0", "false", "no"):
+                    self.send_json(400, {"error": f"diarize: ожидается true или false, получено {value!r}"})
+                    return
+                diarize = value in ("1", "true", "yes")
+            num_speakers = None
+            if "num_speakers" in params:
+                value = params["num_speakers"][0]
+                if not value.isdigit() or int(value) < 1:
+                    self.send_json(400, {"error": f"num_speakers: ожидается положительное число, получено {value!r}"})
+                    return
+                num_speakers = int(value)
+
+            job_id = os.urandom(6).hex()
+            upload_path = upload_dir / job_id / name
+            # Загрузка пишется на диск порциями, а не накапливается в памяти
+            try:
+                upload_path.parent.mkdir()
+                with open(upload_path, "wb") as f:
+                    remaining = length
+                    while remaining > 0:
+                        data = self.rfile.read(min(remaining, 1024 * 1024))
+                        if not data:
+                            break
+                        f.write(data)
+                        remaining -= len(data)
+            except OSError as e:
+                shutil.rmtree(upload_path.parent, ignore_errors=True)
+                self.send_json(500, {"error": f"не удалось сохранить загрузку: {e}"})
+                return
+            if remaining > 0:
+                shutil.rmtree(upload_path.parent, ignore_errors=True)
+                self.send_json(400, {"error": "загрузка прервана"})
+                return
+            job = pipeline.submit(upload_path, job_id=job_id, diarize=diarize, num_speakers=num_speakers,
+                                  on_finish=finish_job)
+            with jobs_lock:
+                jobs[job_id] = job
+            print(f"📥 Задание {job_id}: {name} ({length / 1024 / 1024:.1f} МБ)")
+            self.send_json(202, job_status(job))
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if parts == ["metrics"]:
+                self.send_body(200, telemetry.prometheus_text(), "text/plain; version=0.0.4")
+            elif parts == ["jobs"]:
+                with jobs_lock:
+                    listing = [job_status(job) for job in jobs.values()]
+                self.send_json(200, listing)
+            elif len(parts) == 2 and parts[0] == "jobs":
+                job = self.find_job(parts[1])
+                if job:
+                    self.send_json(200, job_status(job))
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] in ("transcript", "summary"):
+                job = self.find_job(parts[1])
+                if not job:
+                    return
+                path = job[f"{parts[2]}_path"]
+                if not path:
+                    self.send_json(409, {"error": "результат еще не готов", "status": job["status"]})
+                    return
+                transcript_format = parse_qs(url.query).get("format", ["txt"])[0]
+                if parts[2] == "summary":
+                    self.send_body(200, Path(path).read_bytes(), "text/markdown; charset=utf-8")
+                elif transcript_format == "txt":
+                    self.send_body(200, Path(path).read_bytes(), "text/plain; charset=utf-8")
+                elif transcript_format == "json":
+                    self.send_body(200, segments_path_for(path).read_bytes(), "application/json; charset=utf-8")
+                elif transcript_format in TRANSCRIPT_FORMATS:
+                    # Субтитры собираются из сохраненных сегментов по запросу
+                    body = TRANSCRIPT_FORMATS[transcript_format](load_segments(segments_path_for(path))["segments"])
+                    content_type = "text/vtt" if transcript_format == "vtt" else "application/x-subrip"
+                    self.send_body(200, body, f"{content_type}; charset=utf-8")
+                else:
+                    self.send_json(400, {"error": f"неизвестный формат: {transcript_format}"})
+            else:
+                self.send_json(404, {"error": "неизвестный адрес"})
+
+    server = ThreadingHTTPServer((host, port), JobsHandler)
+    server.daemon_threads = True
+    return server
+
+def whisper_model_file(model_name):
+    """Путь к файлу модели Whisper в кэше whisper (без импорта whisper и torch)"""
+    if os.path.isfile(model_name):
+        return Path(model_name)
+    cache_root = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return cache_root / "whisper" / WHISPER_MODEL_FILES.get(model_name, f"{model_name}.pt")
+
+def preflight_checks(diarize=False):
+    """
+    Быстрые проверки окружения без загрузки моделей: ffmpeg и ffprobe, пакет и файл модели
+    Whisper, доступность Ollama и наличие модели LLM. Проверки выполняются параллельно.
+    Возвращает словарь {проверка: (статус, подробности)}; статус None — проверить не удалось.
+    """
+    def check_binary(name):
+        if not shutil.which(name):
+            return False, "не найден в PATH"
+        output = subprocess.run([name, "-version"], capture_output=True, text=True, timeout=5).stdout
+        return True, output.splitlines()[0] if output else shutil.which(name)
+
+    def check_whisper():
+        if importlib.util.find_spec("whisper") is None:
+            return False, "пакет openai-whisper не установлен"
+        path = whisper_model_file(WHISPER_MODEL)
+        if not path.is_file():
+            return False, f"нет файла {path} (модель скачается при первом запуске)"
+        return True, f"{path} ({path.stat().st_size / 1024 ** 3:.1f} ГБ)"
+
+    def check_module(name):
+        if importlib.util.find_spec(name) is None:
+            return False, f"модуль {name} не установлен"
+        return True, "установлен"
+
+    def ollama_models():
+        response = get_ollama_client().get("/api/tags", timeout=PREFLIGHT_TIMEOUT, retries=0)
+        response.raise_for_status()
+        return {m.get("name") for m in response.json().get("models", [])}
+
+    def safe(check, *args):
+        try:
+            return check(*args)
+        except Exception as e:
+            return False, str(e)
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = {
+            "ffmpeg": executor.submit(safe, check_binary, "ffmpeg"),
+            "ffprobe": executor.submit(safe, check_binary, "ffprobe"),
+            f"whisper {WHISPER_MODEL}": executor.submit(safe, check_whisper),
+        }
+        if diarize:
+            futures["nemo"] = executor.submit(safe, check_module, "nemo")
+        tags = executor.submit(ollama_models)
+        checks = {name: future.result() for name, future in futures.items()}
+        try:
+            models = tags.result()
+        except Exception as e:
+            models = None
+            error = e
+
+    if models is not None:
+        checks["ollama"] = (True, OLLAMA_URL)
+        # Модель без тега Ollama хранит как <имя>:latest
+        wanted = LLM_MODEL if ":" in LLM_MODEL else f"{LLM_MODEL}:latest"
+        checks[f"ollama {LLM_MODEL}"] = (True, "загружена") if wanted in models else \\
+            (False, f"не загружена (ollama pull {LLM_MODEL})")
+    elif shutil.which("ollama"):
+        # Сервер не запущен, но установлен: обработка запустит его сама
+        checks["ollama"] = (None, f"{OLLAMA_URL} не отвечает, сервер будет запущен при обработке")
+        checks[f"ollama {LLM_MODEL}"] = (None, "не проверена: сервер не запущен")
     else:
-        print("⚠️ Процесс завершен с ошибками при сохранении")
-    
-    # Останавливаем сервер Ollama, если мы его запускали
+        checks["ollama"] = (False, f"{OLLAMA_URL} не отвечает и ollama не найдена в PATH ({error})")
+    return checks
+
+def preflight_key(diarize=False):
+    """Ключ результата --check: модели, адрес Ollama и PATH, в котором ищутся программы"""
+    return hash_key("preflight", WHISPER_MODEL, LLM_MODEL, OLLAMA_URL, diarize, os.environ.get("PATH", ""))
+
+def load_preflight(cache_dir, key):
+    """Сохраненный успешный результат --check, если он не старше PREFLIGHT_TTL_SEC, иначе None"""
+    try:
+        with open(Path(cache_dir) / "preflight.json", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if saved.get("key") != key or time.time() - saved.get("checked_at", 0) > PREFLIGHT_TTL_SEC:
+        return None
+    return saved
+
+def run_preflight(args, audio_files=()):
+    """
+    --check: проверяет окружение и печатает результат. Успешный результат сохраняется
+    в каталоге кэша на PREFLIGHT_TTL_SEC: повторные --check и обычные запуски в это время
+    не проверяют модель Ollama заново. Возвращает True, если можно запускать обработку.
+    """
+    start = time.monotonic()
+    profile, reason, audio_seconds = resolve_model_tier(args, audio_files)
+    print(f"🎚️ Профиль {profile}: Whisper {WHISPER_MODEL}, {LLM_MODEL} ({reason})")
+    key = preflight_key(args.diarize)
+    saved = None if args.refresh else load_preflight(args.cache_dir, key)
+    if saved:
+        checks = saved["checks"]
+        print(f"♻️ Результат проверки {time.time() - saved['checked_at']:.0f} с назад (--refresh — проверить заново)")
+    else:
+        checks = preflight_checks(args.diarize)
+
+    for name, (status, detail) in checks.items():
+        icon = "✅" if status else ("⚠️" if status is None else "❌")
+        print(f"  {icon} {name}: {detail}")
+    ok = all(status is not False for status, detail in checks.values())
+
+    if ok and not saved:
+        try:
+            Path(args.cache_dir).mkdir(parents=True, exist_ok=True)
+            with open(Path(args.cache_dir) / "preflight.json", "w", encoding="utf-8") as f:
+                json.dump({"key": key, "checked_at": time.time(), "checks": checks}, f, ensure_ascii=False)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить результат проверки: {e}")
+    elapsed = format_duration(time.monotonic() - start)
+    print(f"🎉 Все готово к обработке ({elapsed})" if ok else f"❌ Окружение не готово ({elapsed})")
+    return ok
+
+def resolve_model_tier(args, audio_files):
+    """Выбирает и применяет профиль моделей; в режиме auto учитывает суммарную длительность записей"""
+    audio_seconds = None
+    if args.profile == "auto" and audio_files:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            durations = list(executor.map(probe_audio_duration, audio_files))
+        audio_seconds = sum(d for d in durations if d) or None
+    profile, reason = choose_model_tier(args.profile, audio_seconds,
+                                        args.deadline * 60 if args.deadline else None, args.memory_gb)
+    apply_model_tier(profile)
+    return profile, reason, audio_seconds
+
+def formats_arg(value):
+    """Разбирает список форматов транскрипта через запятую"""
+    formats = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in formats if name not in TRANSCRIPT_FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"неизвестные форматы: {', '.join(unknown)} "
+                                         f"(доступны {', '.join(TRANSCRIPT_FORMATS)})")
+    return formats
+
+def segment_workers_arg(value):
+    """Разбирает значение --parallel-segments: число процессов или auto (число подбирается после выбора профиля)"""
+    if value == "auto":
+        return value
+    try:
+        return max(0, int(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError("ожидается число или auto")
+
+def parse_args(argv=None):
+    """Разбирает аргументы командной строки"""
+    parser = argparse.ArgumentParser(
+        description="Транскрибация и краткое содержание записей встреч",
+        epilog="Поиск по архиву: summarize.py index КАТАЛОГ... и summarize.py search ЗАПРОС; "
+               "другие форматы транскрипта: summarize.py export КАТАЛОГ... --formats srt,vtt",
+    )
+    parser.add_argument("inputs", nargs="*",
+                        help="аудиофайлы, каталоги или glob-шаблоны (например, 'records/*.m4a')")
+    parser.add_argument("--live", metavar="SOURCE",
+                        help="живой режим: читать звук из stdin (-), именованного канала или растущего файла")
+    parser.add_argument("--live-window", type=float, default=LIVE_WINDOW_SEC,
+                        help="длина окна транскрибации в живом режиме, с")
+    parser.add_argument("--name", help="имя задания живого режима (по умолчанию live_<дата>_<время>)")
+    parser.add_argument("--serve", type=int, metavar="PORT", default=0,
+                        help="режим сервиса: принимать задания через HTTP API на указанном порту")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="адрес, на котором слушает сервис (по умолчанию только локальный)")
+    parser.add_argument("-o", "--output-dir", default=".",
+                        help="корневой каталог результатов; для каждого файла создается свой подкаталог")
+    parser.add_argument("--transcribe-workers", type=int, default=1,
+                        help="число параллельных потоков Whisper (каждый держит свою модель в памяти)")
+    parser.add_argument("--summarize-workers", type=int, default=1,
+                        help="число параллельных потоков саммаризации")
+    parser.add_argument("--parallel-segments", type=segment_workers_arg, default=0, metavar="N|auto",
+                        help="резать запись по паузам и транскрибировать отрезки в N процессах "
+                             "(auto — по числу ядер и объему памяти; 0 — выключено)")
+    parser.add_argument("--diarize", action="store_true",
+                        help="определять спикеров с помощью NVIDIA NeMo параллельно с транскрибацией")
+    parser.add_argument("--num-speakers", type=int, default=None,
+                        help="известное число спикеров (улучшает диаризацию)")
+    parser.add_argument("--trim-silence", action="store_true",
+                        help=f"вырезать паузы длиннее {TRIM_MIN_SILENCE_SEC:g} с перед транскрибацией (таймкоды сохраняются)")
+    parser.add_argument("--normalize", action="store_true",
+                        help="выравнивать громкость записи (EBU R128) при декодировании")
+    parser.add_argument("--keep-pcm", action="store_true",
+                        help="оставлять декодированный PCM (audio.f32) в каталоге задания для повторных запусков")
+    parser.add_argument("--formats", type=formats_arg, default=[], metavar="srt,vtt",
+                        help="дополнительные форматы транскрипта через запятую: srt, vtt "
+                             "(txt и сегменты с таймкодами <имя>.segments.json сохраняются всегда)")
+    parser.add_argument("--no-cleanup", action="store_true",
+                        help="отправлять в LLM транскрипт как есть, без удаления повторов и слов-паразитов")
+    parser.add_argument("--restart", action="store_true",
+                        help="не продолжать прерванную обработку, а начать задания заново")
+    # По умолчанию — модели, которые загружает install.py; auto может выбрать другие и скачать их
+    parser.add_argument("--profile", choices=["auto", *MODEL_TIERS], default="quality",
+                        help="профиль моделей: fast (small + gemma3:4b), balanced (turbo + gemma3:12b), "
+                             "quality (large-v3 + gemma3:27b, по умолчанию) или auto — по железу, "
+                             "длительности и сроку (недостающие модели скачиваются при первом использовании)")
+    parser.add_argument("--deadline", type=float, metavar="MIN", default=None,
+                        help="срок обработки всех файлов в минутах для --profile auto "
+                             "(по умолчанию — не дольше самих записей)")
+    parser.add_argument("--memory-gb", type=float, default=None,
+                        help="память, доступная моделям, в ГБ (по умолчанию весь объем ОЗУ "
+                             f"за вычетом {MEMORY_RESERVE_GB} ГБ)")
+    parser.add_argument("--check", action="store_true",
+                        help="только проверить окружение (ffmpeg, модель Whisper, Ollama и модель LLM) "
+                             f"и выйти; успешный результат запоминается на {PREFLIGHT_TTL_SEC // 60} мин")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="не читать и не записывать кэш транскриптов и саммари")
+    parser.add_argument("--refresh", action="store_true",
+                        help="игнорировать сохраненные результаты и перезаписать кэш")
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR),
+                        help="каталог кэша (также переменная окружения SUMMARIZER_CACHE_DIR)")
+    parser.add_argument("--cache-size-mb", type=int, default=CACHE_MAX_MB,
+                        help="предельный размер кэша в МБ")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="файл трассы JSON Lines (по умолчанию <output-dir>/trace_<run_id>.jsonl)")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="отдавать метрики Prometheus на http://127.0.0.1:<порт>/metrics во время работы")
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.live and not args.serve and not args.check:
+        parser.error("укажите аудиофайлы, --live SOURCE, --serve PORT или --check")
+    return args
+
+def stop_ollama_server(ollama_process):
+    """Останавливает сервер Ollama, если мы его запускали"""
     if ollama_process:
         with Spinner("🛑 Останавливаем сервер Ollama..."):
             ollama_process.terminate()
@@ -483,11 +3569,148 @@ def main():
                 ollama_process.wait(timeout=10)
             except subprocess.TimeoutExpired:
                 ollama_process.kill()
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("index", "search"):
+        archive_main(sys.argv[1], sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        export_main(sys.argv[2:])
+        return
+    script_start_time = time.monotonic()
+    args = parse_args()
+    if args.check:
+        sys.exit(0 if run_preflight(args, collect_audio_files(args.inputs)) else 1)
+    print("🚀 Начало процесса обработки аудио\\n")
+
+    audio_files = collect_audio_files(args.inputs)
+    if not audio_files and not args.live and not args.serve:
+        print("❌ Не найдено ни одного аудиофайла для обработки")
+        print("   Пример: python summarize.py audio.m4a")
+        sys.exit(1)
+    if audio_files:
+        print(f"📂 Файлов к обработке: {len(audio_files)}")
+
+    telemetry.open(args.trace or Path(args.output_dir) / f"trace_{telemetry.run_id}.jsonl")
+    if args.metrics_port:
+        telemetry.serve_metrics(args.metrics_port)
+        print(f"📈 Метрики: http://127.0.0.1:{args.metrics_port}/metrics")
+
+    # Профиль моделей выбирается до запуска Ollama: от него зависит, какую модель готовить
+    profile, reason, audio_seconds = resolve_model_tier(args, audio_files)
+    models = {"profile": profile, "profile_reason": reason, "whisper_model": WHISPER_MODEL, "llm_model": LLM_MODEL}
+    print(f"🎚️ Профиль {profile}: Whisper {WHISPER_MODEL}, {LLM_MODEL} ({reason})")
+    telemetry.record({"type": "model_tier", **models, "audio_seconds": audio_seconds})
+    if args.parallel_segments == "auto":
+        # Число процессов зависит от размера модели выбранного профиля и того же бюджета памяти
+        args.parallel_segments = auto_segment_workers(args.memory_gb)
+        print(f"🧩 Процессов сегментной транскрибации: {args.parallel_segments}")
     
-    print(f"📝 Полный транскрипт сохранен в {transcript_path}")
+    # Whisper и LLM держатся в памяти вместе, только если помещаются; иначе работают по очереди
+    whisper_copies = max(1, args.transcribe_workers if not args.serve else 1, args.parallel_segments)
+    scheduler = ModelScheduler(args.memory_gb, {"whisper": WHISPER_MEMORY_GB * whisper_copies,
+                                                "llm": LLM_MEMORY_GB})
+    print(scheduler.describe())
 
-    total_time = time.time() - script_start_time
-    print(f"\\n🕐 ОБЩЕЕ ВРЕМЯ ВЫПОЛНЕНИЯ: {timedelta(seconds=int(total_time))}")
+    # Запускаем сервер Ollama, проверяем модель и прогреваем ее в фоне, параллельно с транскрибацией.
+    # Живому режиму нужны обе модели сразу, поэтому для него LLM прогревается всегда
+    # Если недавний --check уже нашел модель, повторно ее не проверяем
+    # (статус None — сервер не отвечал, модель тогда не проверялась)
+    saved = load_preflight(args.cache_dir, preflight_key(args.diarize))
+    checked = bool(saved) and saved["checks"].get(f"ollama {LLM_MODEL}", [None])[0] is True
+    warmup = OllamaWarmup(preload=not scheduler.exclusive or bool(args.live), check_model=not checked).start()
+    
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir, args.cache_size_mb, read=not args.refresh)
+
+    jobs = []
+    if args.live:
+        jobs.append(run_live(args.live, args.output_dir, name=args.name, llm_ready=warmup.wait,
+                             window_sec=args.live_window, cleanup=not args.no_cleanup, formats=args.formats))
+        write_job_manifest(jobs[-1], models)
+
+    preprocess = {"trim_silence": args.trim_silence, "normalize": args.normalize, "keep_pcm": args.keep_pcm}
+    if audio_files:
+        jobs += run_pipeline(
+            audio_files,
+            args.output_dir,
+            transcribe_workers=max(1, args.transcribe_workers),
+            summarize_workers=max(1, args.summarize_workers),
+            segment_workers=args.parallel_segments,
+            cache=cache,
+            llm_ready=warmup.wait,
+            diarize=args.diarize,
+            num_speakers=args.num_speakers,
+            preprocess=preprocess,
+            resume=not args.restart,
+            scheduler=scheduler,
+            models=models,
+            cleanup=not args.no_cleanup,
+            formats=args.formats,
+        )
+
+    if args.serve:
+        # Один поток транскрибации с одной резидентной моделью и не больше саммаризаторов, чем слотов Ollama:
+        # сколько бы заданий ни пришло, нагрузка на машину остается той же
+        pipeline = Pipeline(
+            args.output_dir,
+            transcribe_workers=1,
+            summarize_workers=min(max(1, args.summarize_workers), MAX_PARALLEL_REQUESTS),
+            segment_workers=args.parallel_segments,
+            cache=cache,
+            llm_ready=warmup.wait,
+            diarize=args.diarize,
+            num_speakers=args.num_speakers,
+            preprocess=preprocess,
+            resume=not args.restart,
+            scheduler=scheduler,
+            models=models,
+            cleanup=not args.no_cleanup,
+            formats=args.formats,
+        ).start()
+        server = serve_jobs(pipeline, args.serve, host=args.host)
+        print(f"🌐 Сервис заданий: http://{args.host}:{args.serve}/jobs (Ctrl+C — остановить)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\\n🛑 Останавливаем сервис, дожидаемся заданий в очереди...")
+        server.server_close()
+        jobs += pipeline.close()
+    
+    shutdown_segment_pool()
+    warmup.wait()
+    stop_ollama_server(warmup.process)
+
+    print("\\n📋 Итоги обработки:")
+    for job in jobs:
+        if job["error"]:
+            print(f"  ❌ {job['audio_path'].name}: {job['error']}")
+        else:
+            print(f"  ✅ {job['audio_path'].name}: {job['summary_path']}")
+            print(f"     📝 Полный транскрипт: {job['transcript_path']}")
+
+    failed = [job for job in jobs if job["error"]]
+    if not failed:
+        print("🎉 Процесс завершен успешно!")
+    else:
+        print(f"⚠️ Процесс завершен с ошибками: {len(failed)} из {len(jobs)}")
+
+    total_time = time.monotonic() - script_start_time
+    rss, children_rss = peak_rss_bytes()
+    telemetry.record({
+        "type": "run_end",
+        "total_seconds": round(total_time, 6),
+        "jobs": len(jobs),
+        "failed": len(failed),
+        "peak_rss_bytes": rss,
+        "children_peak_rss_bytes": children_rss,
+    })
+    telemetry.close()
+    print(f"📊 Трасса выполнения: {telemetry.trace_path}")
+    print(f"\\n🕐 ОБЩЕЕ ВРЕМЯ ВЫПОЛНЕНИЯ: {format_duration(total_time)}")
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -507,56 +3730,61 @@ if __name__ == "__main__":
     log_time("Создание скрипта обработки", step_start)
     return True
 
-def main():
+def parse_args(argv=None):
+    """Разбирает аргументы командной строки установщика."""
+    parser = argparse.ArgumentParser(
+        description="Установка компонентов для транскрибации и суммаризации встреч. "
+                    "Уже установленные компоненты и загруженные модели пропускаются."
+    )
+    parser.add_argument("--whisper-model", default=DEFAULT_WHISPER_MODEL,
+                        help=f"Модель Whisper для предварительной загрузки (по умолчанию {DEFAULT_WHISPER_MODEL})")
+    parser.add_argument("--llm-model", default=DEFAULT_LLM_MODEL,
+                        help=f"Модель Ollama для предварительной загрузки (по умолчанию {DEFAULT_LLM_MODEL})")
+    parser.add_argument("--force", action="store_true",
+                        help="Переустановить все компоненты, даже если они уже установлены")
+    return parser.parse_args(argv)
+
+def timed_step(function, *args):
+    """Выполняет этап установки и возвращает его результат и длительность."""
+    step_start = time.time()
+    try:
+        ok = function(*args)
+    except Exception as e:
+        print(f"❌ Этап {function.__name__} завершился с ошибкой: {e}")
+        ok = False
+    return ok, time.time() - step_start
+
+def main(argv=None):
     """
     Основная функция, которая запускает весь процесс установки.
+    FFmpeg, Ollama с загрузкой LLM и загрузка модели Whisper идут параллельно.
+    pip-пакеты ставятся в основном потоке в фиксированном порядке: сначала Whisper
+    (torch с PyPI), затем NeMo, который видит уже установленный torch.
     """
+    args = parse_args(argv)
     # Переменная для хранения времени начала выполнения скрипта
     script_start_time = time.time()
     print("🚀 Начинаем установку всех необходимых компонентов...")
     
-    # Создаем словарь для хранения времени выполнения каждого этапа
-    step_times = {}
-    
-    # 1. Установка FFmpeg
-    print("\n" + "="*50)
-    print("1. УСТАНОВКА FFMPEG")
-    print("="*50)
-    step_start = time.time()
-    ffmpeg_ok = install_ffmpeg()
-    step_times["FFmpeg"] = time.time() - step_start
-    
-    # 2. Установка Whisper
-    print("\n" + "="*50)
-    print("2. УСТАНОВКА OPENAI WHISPER")
-    print("="*50)
-    step_start = time.time()
-    whisper_ok = install_whisper()
-    step_times["Whisper"] = time.time() - step_start
-    
-    # 3. Установка NeMo
-    print("\n" + "="*50)
-    print("3. УСТАНОВКА NVIDIA NEMO")
-    print("="*50)
-    step_start = time.time()
-    nemo_ok = install_nemo()
-    step_times["NeMo"] = time.time() - step_start
-    
-    # 4. Установка Ollama и модели Gemma
-    print("\n" + "="*50)
-    print("4. УСТАНОВКА OLLAMA И МОДЕЛИ GEMMA 3 27B")
-    print("="*50)
-    step_start = time.time()
-    ollama_ok = install_ollama_and_gemma()
-    step_times["Ollama"] = time.time() - step_start
-    
-    # 5. Создание финального скрипта
-    print("\n" + "="*50)
-    print("5. СОЗДАНИЕ ФИНАЛЬНОГО СКРИПТА")
-    print("="*50)
-    step_start = time.time()
-    script_ok = create_processing_script()
-    step_times["Создание скрипта"] = time.time() - step_start
+    steps = {
+        "FFmpeg": (install_ffmpeg, args.force),
+        f"Ollama & {args.llm_model}": (install_ollama_and_gemma, args.llm_model, args.force),
+        "Финальный скрипт": (create_processing_script,),
+    }
+    print(f"⚙️  Параллельно с pip-пакетами выполняются: {', '.join(steps)}, модель Whisper {args.whisper_model}")
+    with ThreadPoolExecutor(max_workers=len(steps) + 1) as executor:
+        futures = {name: executor.submit(timed_step, *step) for name, step in steps.items()}
+        # pip не рассчитан на параллельную установку в одно окружение: пакеты ставятся по очереди здесь
+        results = {"Whisper": timed_step(install_whisper, args.force)}
+        model_step = f"Модель Whisper {args.whisper_model}"
+        if results["Whisper"][0]:
+            futures[model_step] = executor.submit(timed_step, download_whisper_model, args.whisper_model, args.force)
+        else:
+            results[model_step] = (False, 0.0)
+        results["NVIDIA NeMo"] = timed_step(install_nemo, args.force)
+        results.update((name, future.result()) for name, future in futures.items())
+    order = ["FFmpeg", "Whisper", model_step, "NVIDIA NeMo", *steps]
+    results = {name: results[name] for name in dict.fromkeys(order)}
     
     # Итоговый отчет
     total_time = time.time() - script_start_time
@@ -564,26 +3792,27 @@ def main():
     print("УСТАНОВКА ЗАВЕРШЕНА")
     print("="*50)
     print("Статус установки компонентов:")
-    print(f"  FFmpeg: {'✅' if ffmpeg_ok else '❌'}")
-    print(f"  Whisper: {'✅' if whisper_ok else '❌'}")
-    print(f"  NVIDIA NeMo: {'✅' if nemo_ok else '❌'}")
-    print(f"  Ollama & Gemma3:27b: {'✅' if ollama_ok else '❌'}")
-    print(f"  Финальный скрипт: {'✅' if script_ok else '❌'}")
+    for name, (ok, duration) in results.items():
+        print(f"  {name}: {'✅' if ok else '❌'}")
     
-    # Выводим время выполнения каждого этапа
+    # Выводим время выполнения каждого этапа (этапы шли параллельно)
     print("\n⏱️  ВРЕМЯ ВЫПОЛНЕНИЯ ЭТАПОВ:")
-    for step, duration in step_times.items():
-        print(f"  {step}: {timedelta(seconds=int(duration))}")
+    for name, (ok, duration) in results.items():
+        print(f"  {name}: {format_duration(duration)}")
     
-    print(f"\n🕐 ОБЩЕЕ ВРЕМЯ УСТАНОВКИ: {timedelta(seconds=int(total_time))}")
+    print(f"\n🕐 ОБЩЕЕ ВРЕМЯ УСТАНОВКИ: {format_duration(total_time)}")
     
-    if all([ffmpeg_ok, whisper_ok, nemo_ok, ollama_ok, script_ok]):
+    if all(ok for ok, duration in results.values()):
         print("\n🎉 Все компоненты успешно установлены!")
         print("\n📖 ИНСТРУКЦИЯ ПО ИСПОЛЬЗОВАНИЮ:")
         print("   1. Поместите ваш аудиофайл (например, meeting.m4a) в ту же папку.")
         print("   2. Запустите скрипт обработки, указав путь к аудиофайлу:")
         print("      python summarize.py meeting.m4a")
-        print("   3. Результат будет сохранен в файле meeting_summary.md")
+        print("   3. Результат будет сохранен в каталоге meeting_<хэш>/meeting_summary.md")
+        print("   Для пакетной обработки передайте несколько файлов, каталог или glob-шаблон:")
+        print("      python summarize.py records/ -o results")
+        print("   Быстрая проверка окружения перед запуском (ffmpeg, модели, Ollama):")
+        print("      python summarize.py --check")
     else:
         print("\n⚠️  Некоторые компоненты установлены с ошибками.")
         print("   Пожалуйста, проверьте вывод выше и установите недостающие компоненты вручную.")
@@ -591,7 +3820,9 @@ def main():
     print("\n💡 ПРИМЕЧАНИЯ:")
     print("   - Для работы Whisper large-v3 требуется около 12 ГБ VRAM/ОЗУ.")
     print("   - Модель Gemma3:27b требует около 12 ГБ места и достаточного объема ОЗУ/VRAM.")
-    print("   - Первый запуск транскрибации займет время на загрузку модели large-v3.")
+    print("   - Повторный запуск install.py пропускает готовые компоненты и докачивает прерванные загрузки.")
+    print("   - С --profile auto модели подбираются по железу и длительности записей;")
+    print("     модели профилей fast и balanced скачиваются при первом использовании.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file